@@ -0,0 +1,5 @@
+from .manifest import *
+from .runner import *
+from .workqueue import *
+from .changes import *
+from .scheduler import *
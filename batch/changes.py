@@ -0,0 +1,180 @@
+import json
+import time
+from pathlib import Path
+
+from scraper import IMDBScraper
+from scraper.utils import write_json_atomic
+from reports.batch import render_batch
+from batch.scheduler import CrawlScheduler, last_airdate
+
+
+def _episode_key(season, position, episode):
+    # The scraper leaves episode_number empty on some pages, fall back to the position in the season
+    number = episode.get("episode_number") or position + 1
+    return f"{season}:{number}"
+
+
+def episode_ratings(seasons):
+    """
+    Flattens scraped seasons into a {"<season>:<episode>": {"title", "rating"}} dictionary.
+    """
+    episodes = {}
+    for index, season in enumerate(seasons):
+        number = season.get("number", index + 1)
+        for position, episode in enumerate(season.get("episodes", [])):
+            episodes[_episode_key(number, position, episode)] = dict(
+                title=episode["title"], rating=episode["rating"]
+            )
+    return episodes
+
+
+def diff_episodes(old, new):
+    """
+    Compares two episode_ratings dictionaries, returning the episodes that were added
+    and the episodes whose rating changed.
+    """
+    added = []
+    changed = []
+    for key, episode in new.items():
+        before = old.get(key)
+        if before is None:
+            added.append(dict(episode=key, title=episode["title"], rating=episode["rating"]))
+        elif before["rating"] != episode["rating"]:
+            changed.append(
+                dict(
+                    episode=key,
+                    title=episode["title"],
+                    old=before["rating"],
+                    new=episode["rating"],
+                )
+            )
+    return dict(episodes_added=added, ratings_changed=changed)
+
+
+def signals_changed(old, new):
+    """
+    True if any signal known to the old snapshot differs in new. Signals added since the snapshot
+    was written (eg. running_date) do not count, so that upgrading does not re-scrape every show.
+    """
+    return any(old[key] != value for key, value in new.items() if key in old)
+
+
+class ChangeFeed:
+    """
+        Keeps a snapshot of the signals (see IMDBScraper.get_signals) and episode ratings of every show
+        it has seen, so that a nightly run only re-scrapes and re-renders the shows whose signals moved.
+        Every refresh appends one line per updated show to the feed file (JSON lines),
+        with the episodes that were added and the ratings that changed since the previous snapshot.
+    """
+
+    def __init__(self, snapshot_path="./data/snapshots.json", feed_path="./data/changes.jsonl"):
+        self.snapshot_path = Path(snapshot_path)
+        self.feed_path = Path(feed_path)
+        self.snapshots = {}
+        if self.snapshot_path.exists():
+            with self.snapshot_path.open() as fp:
+                self.snapshots = json.load(fp)
+
+    def check(self, show_ids, log=True):
+        """
+        Fetches the signals of every show, and returns a list of (show_id, signals) for the shows
+        that are new or whose signals differ from the stored snapshot.
+        The snapshots of the other shows are marked as checked, so that they are not due again
+        before their refresh interval. Changed shows are only stored by record, once refreshed.
+        """
+        changed = []
+        checked = time.time()
+        unchanged = 0
+        for show_id in show_ids:
+            try:
+                signals = IMDBScraper.get_signals(show_id)
+            except Exception as e:
+                if log:
+                    print(f"Could not check {show_id}: {e}")
+                continue
+            snapshot = self.snapshots.get(show_id)
+            if snapshot is None or signals_changed(snapshot["signals"], signals):
+                changed.append((show_id, signals))
+            else:
+                snapshot.update(
+                    signals=signals, checked=checked, checks=snapshot.get("checks", 0) + 1
+                )
+                unchanged += 1
+        if unchanged:
+            write_json_atomic(self.snapshot_path, self.snapshots)
+        return changed
+
+    def record(self, show_id, signals, seasons):
+        """
+        Stores the new snapshot of a show once it has been re-scraped and re-rendered,
+        and appends its diff against the previous snapshot to the feed. Returns the diff.
+        """
+        episodes = episode_ratings(seasons)
+        previous = self.snapshots.get(show_id, {})
+        diff = diff_episodes(previous.get("episodes", {}), episodes)
+        diff.update(
+            id=show_id,
+            time=time.time(),
+            signals=dict(old=previous.get("signals"), new=signals),
+        )
+        self.snapshots[show_id] = dict(
+            signals=signals,
+            episodes=episodes,
+            scraped=diff["time"],
+            checked=diff["time"],
+            checks=previous.get("checks", 0) + 1,
+            changes=previous.get("changes", 0) + 1,
+            last_airdate=last_airdate(seasons),
+        )
+        write_json_atomic(self.snapshot_path, self.snapshots)
+        self.feed_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.feed_path.open("a") as fp:
+            fp.write(json.dumps(diff) + "\n")
+        return diff
+
+    def _scrape_changed(self, changed, data_dir, scraped, log):
+        for show_id, signals in changed:
+            try:
+                scraper = IMDBScraper(
+                    show_id, log=log, data_dir=data_dir, use_cache=False
+                )
+                scraped[show_id] = (signals, scraper.seasons)
+                scraper.dump()  # Refreshes the data file used by the other pipelines
+            except Exception as e:
+                if log:
+                    print(f"Could not refresh {show_id}: {e}")
+                continue
+            yield scraper
+
+    def refresh(
+        self,
+        show_ids,
+        data_dir="./data",
+        output_dir="./data",
+        color="blue",
+        budget=None,
+        log=True,
+    ):
+        """
+        Re-scrapes and re-renders only the shows in show_ids whose signals changed.
+        With a budget (an estimated number of requests), only the shows a CrawlScheduler
+        picks are checked, starting with the most overdue and popular ones.
+        Returns the list of diffs that were appended to the feed.
+        Shows that fail to scrape or render keep their old snapshot, so they are picked up again next run.
+        """
+        if budget is not None:
+            show_ids = CrawlScheduler(self.snapshots).plan(show_ids, budget)
+        changed = self.check(show_ids, log=log)
+        if log:
+            print(f"{len(changed)} show(s) changed.")
+        scraped = {}
+        diffs = []
+        providers = self._scrape_changed(changed, data_dir, scraped, log)
+        for result in render_batch(providers, output_dir=output_dir, color=color):
+            signals, seasons = scraped.pop(result["id"])
+            if result["error"]:
+                if log:
+                    print(f"Could not render {result['title']}: {result['error']}")
+                continue
+            diffs.append(self.record(result["id"], signals, seasons))
+        return diffs
@@ -0,0 +1,85 @@
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+from scraper.utils import write_json_atomic
+
+
+class Manifest:
+    """
+        Persistent record of the progress of a batch run, one entry per show.
+        Every show moves through STEPS in order; the manifest remembers the last completed step,
+        the number of failed attempts and the last error, and is rewritten atomically on every change.
+    """
+
+    STEPS = ("scraped", "dumped", "rendered")
+
+    def __init__(self, path, max_attempts=3):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.shows = {}
+        if self.path.exists():
+            with self.path.open() as fp:
+                self.shows = json.load(fp)
+
+    def save(self):
+        write_json_atomic(self.path, self.shows)
+
+    def add(self, show_id, title=None):
+        entry = self.shows.setdefault(
+            show_id, dict(title=title, step=None, attempts=0, error=None, updated=None)
+        )
+        if title and not entry["title"]:
+            entry["title"] = title
+        return entry
+
+    def state(self, show_id):
+        """
+        Returns one of "pending", "failed", or the last completed step of the show.
+        """
+        entry = self.shows.get(show_id)
+        if entry is None:
+            return "pending"
+        if entry["error"]:
+            return "failed"
+        return entry["step"] or "pending"
+
+    def next_step(self, show_id):
+        """
+        Returns the first step still to be run for the show, or None if it is complete.
+        """
+        step = self.shows.get(show_id, {}).get("step")
+        if step is None:
+            return self.STEPS[0]
+        index = self.STEPS.index(step) + 1
+        return self.STEPS[index] if index < len(self.STEPS) else None
+
+    def is_runnable(self, show_id):
+        """
+        True if the show has work left, and has not exhausted its attempts.
+        """
+        entry = self.shows.get(show_id)
+        if self.next_step(show_id) is None:
+            return False
+        return entry is None or entry["attempts"] < self.max_attempts
+
+    def _update(self, show_id, **fields):
+        entry = self.add(show_id)
+        entry.update(fields)
+        entry["updated"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.save()
+
+    def advance(self, show_id, step, **info):
+        assert step in self.STEPS
+        self._update(show_id, step=step, error=None, **info)
+
+    def fail(self, show_id, error):
+        attempts = self.shows.get(show_id, {}).get("attempts", 0) + 1
+        self._update(show_id, attempts=attempts, error=str(error))
+
+    def summary(self):
+        counts = {}
+        for show_id in self.shows:
+            state = self.state(show_id)
+            counts[state] = counts.get(state, 0) + 1
+        return counts
@@ -0,0 +1,154 @@
+import json
+from pathlib import Path
+
+from scraper import IMDBScraper
+from scraper.images import image_urls
+from reports.batch import ShowSnapshot, render_batch
+from batch.manifest import Manifest
+from metrics import counter, export_metrics, gauge
+
+
+def _load_dumped(show_id, manifest):
+    """
+        Returns a ShowSnapshot of a dumped show, read from its data file and the metadata stored
+        in the manifest, or None if either is missing (eg. a manifest written by an older version).
+    """
+    entry = manifest.shows[show_id]
+    data_file, metadata = entry.get("data_file"), entry.get("metadata")
+    if not data_file or not metadata or not Path(data_file).exists():
+        return None
+    with open(data_file) as fp:
+        return ShowSnapshot(show_id, json.load(fp), metadata)
+
+
+def _scrape_shows(shows, manifest, data_dir, log):
+    """
+        Runs the scrape and dump steps of every runnable show, recording them in the manifest,
+        and yields data providers for the shows that still need to be rendered.
+        Dumped shows are rendered from their data file, without scraping them again.
+    """
+    for show_id in shows:
+        if not manifest.is_runnable(show_id):
+            continue
+        title = manifest.shows[show_id]["title"] or show_id
+        try:
+            if manifest.next_step(show_id) == "rendered":
+                snapshot = _load_dumped(show_id, manifest)
+                if snapshot is not None:
+                    yield snapshot
+                    continue
+            if log:
+                print(f"Retrieving {title}...")
+            scraper = IMDBScraper(show_id, log=log, data_dir=data_dir)
+            scraper.seasons  # Loads every season, from the data file if it was dumped earlier
+            manifest.shows[show_id]["title"] = scraper.show_metadata["title"]
+            if manifest.next_step(show_id) == "scraped":
+                manifest.advance(show_id, "scraped")
+            if manifest.next_step(show_id) == "dumped":
+                data_file = scraper.dump()
+                if data_file is not None:  # Nothing is written for single season, cached shows
+                    manifest.advance(
+                        show_id,
+                        "dumped",
+                        data_file=str(data_file),
+                        metadata=scraper.show_metadata,
+                    )
+        except Exception as e:
+            manifest.fail(show_id, f"{type(e).__name__}: {e}")
+            counter("popviz_shows_failed_total", "Shows that could not be processed").inc()
+            if log:
+                print(f"Failed to retrieve {title}: {e}")
+            continue
+        yield scraper
+
+
+def run_batch(
+    shows,
+    manifest_path="./data/manifest.json",
+    data_dir="./data",
+    output_dir="./data",
+    color="blue",
+    max_attempts=3,
+    memory_budget=None,
+    metrics=None,
+    images=None,
+    log=True,
+):
+    """
+        Scrapes, dumps and renders every show in shows (an iterable of IMDb IDs, or (title, ID) pairs),
+        checkpointing each step in a Manifest stored at manifest_path.
+
+        Rerunning with the same manifest resumes every show from its first incomplete step:
+        rendered shows are skipped, dumped shows are rendered from their data file,
+        and failed shows are retried until they have failed max_attempts times.
+        With metrics set to a path, the metrics registry is written there periodically
+        (JSON if it ends in .json, Prometheus text otherwise).
+        With images set to a scraper.images.ImageCache, the poster and episode images of every show
+        are fetched concurrently into it, and the poster is embedded in the report.
+        Returns the manifest.
+    """
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(manifest_path, max_attempts=max_attempts)
+    show_ids = []
+    for show in shows:
+        title, show_id = show if isinstance(show, tuple) else (None, show)
+        manifest.add(show_id, title)
+        show_ids.append(show_id)
+    manifest.save()
+    remaining = gauge("popviz_batch_remaining", "Shows left to process in the batch")
+    remaining.set_function(
+        lambda: sum(manifest.is_runnable(show_id) for show_id in show_ids)
+    )
+    with export_metrics(metrics):
+        _run_batch(
+            show_ids, manifest, data_dir, output_dir, color, memory_budget, images, log
+        )
+    return manifest
+
+
+def _fetch_images(providers, images, posters, log):
+    """
+        Fetches the images of every provider into images (an ImageCache) before passing it on,
+        and records the thumbnail of its poster in posters. Missing images never fail a show.
+    """
+    for provider in providers:
+        poster_url = provider.show_metadata.get("poster_url")
+        paths = images.fetch_all(image_urls(provider))
+        if paths.get(poster_url):
+            try:
+                posters[provider.series] = str(images.thumbnail(poster_url))
+            except OSError as e:  # Not an image Pillow can read
+                if log:
+                    print(f"Skipping the poster of {provider.series}: {e}")
+        yield provider
+
+
+def _run_batch(
+    show_ids, manifest, data_dir, output_dir, color, memory_budget, images, log
+):
+    providers = _scrape_shows(show_ids, manifest, data_dir, log)
+    posters = {}
+    if images is not None:
+        providers = _fetch_images(providers, images, posters, log)
+    for result in render_batch(
+        providers,
+        output_dir=output_dir,
+        color=color,
+        memory_budget=memory_budget,
+        posters=posters,
+    ):
+        if result["error"]:
+            counter("popviz_shows_failed_total", "Shows that could not be processed").inc()
+            manifest.fail(result["id"], result["error"])
+        else:
+            counter("popviz_shows_rendered_total", "Shows rendered").inc()
+            manifest.advance(
+                result["id"],
+                "rendered",
+                file=result["file"],
+                peak_memory=result["peak_memory"],
+            )
+        if log:
+            status = result["error"] or f"saved to {result['file']}"
+            print(f"{result['title']}: {status}")
@@ -0,0 +1,140 @@
+import math
+import time
+from datetime import datetime
+
+from regex import regex as re
+
+DAY = 24 * 3600
+CHECK_REQUESTS = 1  # IMDBScraper.get_signals only fetches the show page
+AIRDATE_FORMATS = ("%d %b %Y", "%b %Y", "%Y")
+
+
+def parse_airdate(airdate):
+    """
+    Parses an IMDb airdate ("12 Sep. 2019", "Sep. 2019" or "2019") into a timestamp, or None.
+    """
+    airdate = airdate.replace(".", "").strip()
+    for date_format in AIRDATE_FORMATS:
+        try:
+            return datetime.strptime(airdate, date_format).timestamp()
+        except ValueError:
+            continue
+    return None
+
+
+def last_airdate(seasons):
+    """
+    Returns the timestamp of the most recent episode that has already aired, or None.
+    """
+    now = time.time()
+    airdates = (
+        parse_airdate(episode.get("airdate", ""))
+        for season in seasons
+        for episode in season["episodes"]
+    )
+    aired = [airdate for airdate in airdates if airdate is not None and airdate <= now]
+    return max(aired, default=None)
+
+
+def parse_count(count):
+    """
+    Parses a number of ratings as shown by IMDb ("1,234", "12K", "1.2M") into an int.
+    """
+    result = re.search(r"([\d.,]+)\s*([KkMm]?)", count or "")
+    if result is None:
+        return 0
+    number = float(result.group(1).replace(",", ""))
+    multiplier = {"k": 1e3, "m": 1e6}.get(result.group(2).lower(), 1)
+    return int(number * multiplier)
+
+
+def is_running(running_date):
+    # Ongoing shows have an open ended range, eg. "2005–"
+    return bool(running_date) and running_date.strip()[-1] in "–-"
+
+
+def last_checked(snapshot):
+    # Snapshots written before checks were recorded only know when the show was scraped
+    return snapshot.get("checked", snapshot["scraped"])
+
+
+class CrawlScheduler:
+    """
+        Decides which shows to check in a run, from the snapshots kept by ChangeFeed.
+
+        Every show gets a refresh interval: a day for shows that aired an episode in the last month,
+        a week for other running shows (or shows whose running date is unknown),
+        and half a year for shows that have ended.
+        Its priority is how overdue it is (time since its signals were last checked over that interval),
+        weighted by the log of its number of ratings, so popular shows go first.
+        Shows that were never scraped come before everything else.
+    """
+
+    def __init__(
+        self,
+        snapshots,
+        airing_interval=DAY,
+        running_interval=7 * DAY,
+        ended_interval=180 * DAY,
+        now=None,
+    ):
+        self.snapshots = snapshots
+        self.airing_interval = airing_interval
+        self.running_interval = running_interval
+        self.ended_interval = ended_interval
+        self.now = now or time.time()
+
+    def refresh_interval(self, snapshot):
+        running_date = snapshot["signals"].get("running_date")
+        if running_date is None:  # Snapshot older than running_date, the show might still run
+            return self.running_interval
+        if not is_running(running_date):
+            return self.ended_interval
+        aired = snapshot.get("last_airdate")
+        if aired is not None and self.now - aired < 30 * DAY:
+            return self.airing_interval
+        return self.running_interval
+
+    def priority(self, show_id):
+        snapshot = self.snapshots.get(show_id)
+        if snapshot is None:
+            return math.inf
+        staleness = (self.now - last_checked(snapshot)) / self.refresh_interval(snapshot)
+        popularity = 1 + math.log10(1 + parse_count(snapshot["signals"]["num_ratings"]))
+        return staleness * popularity
+
+    def cost(self, show_id):
+        """
+        Estimated number of requests needed to check a show: one for its signals, plus its show page
+        and every season if they changed. Known shows are charged the scrape in proportion to how often
+        their signals changed when they were checked before, shows never scraped are charged all of it.
+        """
+        snapshot = self.snapshots.get(show_id)
+        if snapshot is None:
+            return CHECK_REQUESTS + 2 + 10
+        scrape = 2 + (snapshot["signals"].get("latest_season") or 10)
+        change_rate = (snapshot.get("changes", 0) + 1) / (snapshot.get("checks", 0) + 2)
+        return CHECK_REQUESTS + change_rate * scrape
+
+    def plan(self, show_ids, budget):
+        """
+        Returns the shows to check in this run, most valuable first,
+        keeping the total estimated number of requests under budget. Shows that are not due are left out.
+        """
+        candidates = []
+        for show_id in show_ids:
+            snapshot = self.snapshots.get(show_id)
+            if snapshot is not None:
+                age = self.now - last_checked(snapshot)
+                if age < self.refresh_interval(snapshot):
+                    continue
+            candidates.append((self.priority(show_id), show_id))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        planned = []
+        for _, show_id in candidates:
+            cost = self.cost(show_id)
+            if cost <= budget:
+                planned.append(show_id)
+                budget -= cost
+        return planned
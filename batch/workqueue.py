@@ -0,0 +1,288 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from scraper import IMDBScraper
+from reports import TVReport
+from reports.batch import PeakMemory
+from metrics import counter, export_metrics, gauge
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class WorkQueue:
+    """
+        Work queue of IMDb IDs backed by a single SQLite file, so that any number of workers
+        (processes, containers or machines with access to the same file) can split a batch without a broker.
+
+        Workers lease shows for lease_timeout seconds. A lease that expires (eg. the worker died)
+        counts as a failed attempt, and the show goes back to the queue until it has been tried max_attempts times.
+        Note: SQLite locking is only as reliable as the file system's, avoid NFS mounts without proper lock support.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            show_id TEXT PRIMARY KEY,
+            title TEXT,
+            state TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            result TEXT,
+            updated REAL
+        )
+    """
+
+    def __init__(self, path, lease_timeout=600, max_attempts=3):
+        self.path = Path(path)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), timeout=60, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute(self.SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can never lease the same show.
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.db
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def put(self, shows):
+        """
+        Adds shows (IMDb IDs, or (title, ID) pairs) to the queue. Shows already queued are left untouched.
+        """
+        rows = []
+        for show in shows:
+            title, show_id = show if isinstance(show, tuple) else (None, show)
+            rows.append((show_id, title, time.time()))
+        with self._transaction() as db:
+            db.executemany(
+                "INSERT OR IGNORE INTO jobs (show_id, title, updated) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def _requeue_expired(self, db, now):
+        db.execute(
+            """
+            UPDATE jobs SET
+                attempts = attempts + 1,
+                error = 'Lease expired on ' || worker,
+                state = CASE WHEN attempts + 1 < ? THEN 'pending' ELSE 'failed' END,
+                worker = NULL, lease_expires = NULL, updated = ?
+            WHERE state = 'leased' AND lease_expires < ?
+            """,
+            (self.max_attempts, now, now),
+        )
+
+    def lease(self, worker, n=1):
+        """
+        Leases up to n pending shows to worker, returning their IDs.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            self._requeue_expired(db, now)
+            show_ids = [
+                row["show_id"]
+                for row in db.execute(
+                    "SELECT show_id FROM jobs WHERE state = 'pending' ORDER BY rowid LIMIT ?",
+                    (n,),
+                )
+            ]
+            db.executemany(
+                """
+                UPDATE jobs SET state = 'leased', worker = ?, lease_expires = ?, updated = ?
+                WHERE show_id = ?
+                """,
+                [(worker, now + self.lease_timeout, now, show_id) for show_id in show_ids],
+            )
+        return show_ids
+
+    def _update_lease(self, show_id, worker, assignments, params):
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                f"""
+                UPDATE jobs SET {assignments}, updated = ?
+                WHERE show_id = ? AND worker = ? AND state = 'leased'
+                """,
+                (*params, now, show_id, worker),
+            )
+        # False means that the lease expired, and the show now belongs to someone else.
+        return cursor.rowcount == 1
+
+    def renew(self, show_id, worker):
+        return self._update_lease(
+            show_id, worker, "lease_expires = ?", (time.time() + self.lease_timeout,)
+        )
+
+    @contextmanager
+    def heartbeat(self, show_id, worker, interval=None):
+        """
+        Renews the lease of worker on show_id every interval seconds (a third of lease_timeout by default)
+        in a background thread while the block runs. Yields a threading.Event, set once the lease is lost.
+        """
+        interval = interval or self.lease_timeout / 3
+        lost, stop = threading.Event(), threading.Event()
+
+        def beat():
+            # SQLite connections cannot be shared between threads
+            queue = WorkQueue(self.path, self.lease_timeout, self.max_attempts)
+            try:
+                while not stop.wait(interval):
+                    if not queue.renew(show_id, worker):
+                        lost.set()
+                        return
+            finally:
+                queue.close()
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield lost
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, show_id, worker, result):
+        return self._update_lease(
+            show_id,
+            worker,
+            "state = 'done', error = NULL, lease_expires = NULL, result = ?",
+            (json.dumps(result),),
+        )
+
+    def fail(self, show_id, worker, error):
+        return self._update_lease(
+            show_id,
+            worker,
+            """
+            attempts = attempts + 1, error = ?, worker = NULL, lease_expires = NULL,
+            state = CASE WHEN attempts + 1 < ? THEN 'pending' ELSE 'failed' END
+            """,
+            (str(error), self.max_attempts),
+        )
+
+    def stats(self):
+        """
+        Returns the number of shows in each state (pending, leased, done, failed).
+        """
+        rows = self.db.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state")
+        return {row["state"]: row["n"] for row in rows}
+
+    def results(self):
+        """
+        Yields a dictionary per finished show, with its result (or last error) and the worker that produced it.
+        """
+        rows = self.db.execute(
+            "SELECT * FROM jobs WHERE state IN ('done', 'failed') ORDER BY rowid"
+        )
+        for row in rows:
+            data = dict(row)
+            data["result"] = json.loads(data["result"]) if data["result"] else None
+            yield data
+
+    def close(self):
+        self.db.close()
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _process_show(show_id, lost, data_dir, output_dir, color, log):
+    def check_lease():
+        if lost.is_set():
+            raise LeaseLost(f"Lost the lease on {show_id}, another worker now owns it.")
+
+    scraper = IMDBScraper(show_id, log=log, data_dir=data_dir)
+    scraper.seasons
+    check_lease()
+    scraper.dump()
+    with PeakMemory() as memory:
+        with TVReport(data_provider=scraper) as reporter:
+            reporter.heatmap(color=color)
+            check_lease()
+            output_file = reporter.save_file(output_dir=output_dir)
+    return dict(
+        title=scraper.show_metadata["title"],
+        file=str(output_file),
+        peak_memory=memory.growth,
+    )
+
+
+def run_worker(
+    queue,
+    worker=None,
+    data_dir="./data",
+    output_dir="./data",
+    color="blue",
+    poll_interval=10,
+    metrics=None,
+    log=True,
+):
+    """
+        Leases shows from queue (a WorkQueue) one at a time, and scrapes, dumps and renders them,
+        until the queue has neither pending nor leased shows left.
+        Returns the number of shows this worker completed or failed (not those lost to other workers).
+        Start as many workers as needed, on as many machines as can see the queue file.
+        With metrics set to a path, the metrics registry is written there periodically.
+    """
+    worker = worker or default_worker_id()
+    with export_metrics(metrics):
+        return _work(queue, worker, data_dir, output_dir, color, poll_interval, log)
+
+
+def _update_queue_gauges(queue):
+    stats = queue.stats()
+    for state in ("pending", "leased", "done", "failed"):
+        gauge(f"popviz_queue_{state}", f"Shows {state} in the work queue").set(
+            stats.get(state, 0)
+        )
+    return stats
+
+
+def _work(queue, worker, data_dir, output_dir, color, poll_interval, log):
+    processed = 0
+    while True:
+        show_ids = queue.lease(worker)
+        stats = _update_queue_gauges(queue)
+        if not show_ids:
+            if not stats.get("leased"):
+                return processed
+            time.sleep(poll_interval)  # Others might still fail, or lose their lease
+            continue
+        show_id = show_ids[0]
+        if log:
+            print(f"[{worker}] Processing {show_id}...")
+        try:
+            with queue.heartbeat(show_id, worker) as lost:
+                result = _process_show(show_id, lost, data_dir, output_dir, color, log)
+        except LeaseLost as e:  # The show now belongs to another worker
+            if log:
+                print(f"[{worker}] {e}")
+        except Exception as e:
+            counter("popviz_shows_failed_total", "Shows that could not be processed").inc()
+            if queue.fail(show_id, worker, f"{type(e).__name__}: {e}"):
+                processed += 1
+            if log:
+                print(f"[{worker}] Failed {show_id}: {e}")
+        else:
+            counter("popviz_shows_rendered_total", "Shows rendered").inc()
+            if queue.complete(show_id, worker, result):
+                processed += 1
+            elif log:
+                print(f"[{worker}] Lost the lease on {show_id}, its result was discarded.")
@@ -1,13 +1,23 @@
 import sys
 import argparse
 
-from scraper import IMDBScraper
-from search import search_imdb
-from reports import TVReport
+from cli.daemon import DaemonError, forward, run_report, run_search, serve
+
+
+def run_job(op, job, **request):
+    """
+    Hands the job over to the popviz daemon if one is running, or runs it in this process.
+    """
+    try:
+        forwarded, result = forward(op, **request)
+        return result if forwarded else job(request)
+    except (DaemonError, ValueError) as e:  # eg. a show without episodes
+        print(f"\n{e}")
+        sys.exit(1)
 
 
 def get_results_from_imdb(query):
-    results = search_imdb(query)[:10]
+    results = run_job("search", run_search, query=query)
     if not results:
         print("No results found! Check the search term.")
         sys.exit(1)
@@ -45,10 +55,59 @@ def get_results_from_imdb(query):
     return chosen
 
 
+def metrics_argument(parser):
+    parser.add_argument(
+        "--metrics",
+        help="Periodically write metrics to this file: JSON if it ends in .json, "
+        "Prometheus text format otherwise.",
+        default=None,
+    )
+
+
+def serve_daemon(argv):
+    parser = argparse.ArgumentParser(
+        prog="popviz serve",
+        description="Keep popviz warm, and run the jobs of other popviz commands.",
+    )
+    metrics_argument(parser)
+    args = parser.parse_args(argv)
+    serve(metrics=args.metrics)
+
+
+def serve_reports(argv):
+    parser = argparse.ArgumentParser(
+        prog="popviz http",
+        description="Serve reports on demand, at /report/<imdb_id>.<png|svg|pdf>?color=<red|blue>.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Defaults to 127.0.0.1.")
+    parser.add_argument("--port", type=int, default=8000, help="Defaults to 8000.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Maximum number of reports rendered at once. Defaults to the number of CPUs.",
+    )
+    metrics_argument(parser)
+    args = parser.parse_args(argv)
+
+    from cli.webserver import serve_http
+
+    serve_http(args.host, args.port, metrics=args.metrics, workers=args.workers)
+
+
 def main():
+    if sys.argv[1:2] == ["serve"]:
+        serve_daemon(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["http"]:
+        serve_reports(sys.argv[2:])
+        return
+
     print()
     parser = argparse.ArgumentParser(
-        description="Generate beautiful reports of IMDb ratings data."
+        description="Generate beautiful reports of IMDb ratings data.",
+        epilog="Run `popviz serve` to start a daemon that keeps popviz warm. "
+        "While it is running, every popviz command is handed over to it.",
     )
 
     input_term_group = parser.add_mutually_exclusive_group()
@@ -76,6 +135,24 @@ def main():
         default="blue",
     )
 
+    parser.add_argument(
+        "--poster",
+        help="Include the poster of the show in the report.",
+        action="store_true",
+    )
+
+    preview_group = parser.add_mutually_exclusive_group()
+    preview_group.add_argument(
+        "--preview",
+        help="Save a quick low-resolution preview first, then render the report in the background.",
+        action="store_true",
+    )
+    preview_group.add_argument(
+        "--preview-only",
+        help="Only save the quick low-resolution preview.",
+        action="store_true",
+    )
+
     args = parser.parse_args()
 
     if not args.id:
@@ -90,14 +167,21 @@ def main():
     else:
         chosen_id = args.id
 
-    print("Retrieving show data...")
-    scraper = IMDBScraper(chosen_id)
-    reporter = TVReport(data_provider=scraper)
-
-    print("\nGenerating report...")
-    reporter.heatmap(color=args.colorscheme)
-    file = reporter.save_file(output_dir="./data", filename=args.output)
-    print(f"Report saved to {file.absolute()}.")
+    request = dict(
+        id=chosen_id,
+        output=args.output,
+        colorscheme=args.colorscheme,
+        poster=args.poster,
+        preview=args.preview,
+        preview_only=args.preview_only,
+    )
+    file = run_job("report", run_report, **request)
+    if args.preview_only:
+        return
+    if args.preview:
+        print(f"Report will be saved to {file}.")
+    else:
+        print(f"Report saved to {file}.")
 
 
 if __name__ == "__main__":
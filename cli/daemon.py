@@ -0,0 +1,336 @@
+import io
+import json
+import os
+import pickle
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import traceback
+from contextlib import redirect_stdout
+from pathlib import Path
+
+# Note: numpy, matplotlib, seaborn, bs4 and friends are only imported by the jobs themselves,
+# so that forwarding a command to a running daemon stays cheap.
+
+CONNECT_TIMEOUT = 1  # Seconds
+IDLE_TIMEOUT = 60  # Seconds without any output from the daemon before a client gives up on it
+
+
+def socket_path():
+    user = os.getuid() if hasattr(os, "getuid") else os.getlogin()
+    default = Path(tempfile.gettempdir()) / f"popviz-{user}.sock"
+    return Path(os.environ.get("POPVIZ_SOCKET", default))
+
+
+def run_search(request):
+    from search import search_imdb
+
+    return search_imdb(request["query"])[:10]
+
+
+def _render_in_background(job):
+    """
+    Starts a fresh Python process to render the report described by job (see _render_job),
+    returning True, or returns False if it could not be started. The daemon is not forked for this,
+    as a fork can copy locks held by its other threads (eg. export_metrics) into the child.
+    """
+    root = str(Path(__file__).resolve().parent.parent)  # So that cli can be imported from any directory
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    try:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "cli.daemon"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,  # In the daemon, stdout is the client's socket
+            env=env,
+            start_new_session=True,
+        )
+        with process.stdin:
+            pickle.dump(job, process.stdin)
+    except OSError:
+        return False
+    return True
+
+
+def _render_job(job):
+    """
+    Renders and saves the report of job["show"] (a ShowSnapshot), in the background process.
+    If it fails, the traceback goes to job["error_log"] and stderr, and the process exits with status 1.
+    The timings of the report are sent to the daemon at job["daemon"], if any.
+    """
+    from metrics import REGISTRY
+    from reports import TVReport
+
+    try:
+        with TVReport(data_provider=job["show"]) as reporter:
+            reporter.heatmap(color=job["color"], poster=job["poster"])
+            reporter.save_file(output_dir=job["output_dir"], filename=job["filename"])
+    except BaseException:
+        message = traceback.format_exc()
+        try:
+            Path(job["error_log"]).write_text(message)
+        except OSError:
+            pass
+        sys.stderr.write(f"popviz: the report could not be rendered\n{message}")
+        sys.exit(1)
+    finally:
+        if job["daemon"]:
+            try:
+                forward("metrics", path=job["daemon"], metrics=REGISTRY.dump())
+            except (DaemonError, OSError):
+                pass  # The daemon may have stopped since
+
+
+def run_report(request):
+    """
+    Scrapes and renders the report of request["id"], relative to request["cwd"].
+    Returns the path of the saved report.
+    With request["preview"] set, a quick preview is saved first and the full report is rendered
+    in the background (or not at all with request["preview_only"]).
+    """
+    from scraper import IMDBScraper
+    from scraper.images import ImageCache
+    from reports import TVReport
+    from reports.batch import ShowSnapshot
+
+    data_dir = Path(request.get("cwd") or Path.cwd()) / "data"
+    color = request.get("colorscheme", "blue")
+    print("Retrieving show data...")
+    scraper = IMDBScraper(request["id"], data_dir=data_dir)
+    with TVReport(data_provider=scraper) as reporter:
+        if request.get("preview") or request.get("preview_only"):
+            preview = reporter.save_preview(
+                filename=request.get("output"), output_dir=data_dir, color=color
+            )
+            print(f"Preview saved to {preview.absolute()}.")
+            if request.get("preview_only"):
+                return str(preview.absolute())
+
+        poster = None
+        poster_url = scraper.show_metadata.get("poster_url")
+        if request.get("poster") and poster_url:
+            try:
+                poster = ImageCache(cache_dir=data_dir / "images").thumbnail(poster_url)
+            except OSError as e:  # Failed download (requests errors are OSErrors), or not an image
+                print(f"Could not fetch the poster, rendering without it: {e}")
+
+        file = reporter.output_path(request.get("output"), data_dir)
+        error_log = file.with_suffix(".error.log")
+        if error_log.exists():
+            error_log.unlink()  # Left by an earlier failed render
+        job = dict(
+            show=ShowSnapshot.from_provider(scraper),
+            color=color,
+            poster=poster,
+            output_dir=data_dir,
+            filename=request.get("output"),
+            error_log=error_log,
+            daemon=request.get("daemon"),
+        )
+        if request.get("preview") and _render_in_background(job):
+            print("\nGenerating the full report in the background...")
+            print(f"If it fails, the error will be written to {error_log.absolute()}.")
+        else:
+            print("\nGenerating report...")
+            reporter.heatmap(color=color, poster=poster)
+            file = reporter.save_file(output_dir=data_dir, filename=request.get("output"))
+    return str(file.absolute())
+
+
+def merge_metrics(request):
+    """
+    Adds the metrics of a background render to those of the daemon.
+    """
+    from metrics import REGISTRY
+
+    REGISTRY.merge(request["metrics"])
+
+
+JOBS = {"search": run_search, "report": run_report, "metrics": merge_metrics}
+
+
+class _SocketWriter(io.TextIOBase):
+    """
+        Stands in for stdout while a job runs, forwarding every printed line to the client.
+    """
+
+    def __init__(self, send):
+        self.send = send
+
+    def write(self, text):
+        if text:
+            self.send(dict(log=text))
+        return len(text)
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:  # A client checking whether the daemon is up
+            return
+        request = json.loads(line)
+        request["daemon"] = self.server.server_address  # Where background renders report back
+        try:
+            with redirect_stdout(_SocketWriter(self.send)):
+                result = JOBS[request["op"]](request)
+        except Exception as e:
+            self.send(dict(error=f"{type(e).__name__}: {e}"))
+        else:
+            self.send(dict(result=result))
+
+
+def _collect_metrics(read):
+    from metrics import REGISTRY
+
+    with os.fdopen(read) as pipe:
+        line = pipe.readline()  # Empty if the child died before sending its metrics
+    if line:
+        REGISTRY.merge(json.loads(line))
+
+
+class _Server(getattr(socketserver, "ForkingMixIn", object), socketserver.UnixStreamServer):
+    """
+        Runs every job in a forked child, so that clients do not wait for each other
+        and every job has its own stdout. The children send their metrics back to the daemon.
+    """
+
+    def process_request(self, request, client_address):
+        read, self.metrics_pipe = os.pipe()
+        super().process_request(request, client_address)  # Only returns in the daemon
+        os.close(self.metrics_pipe)
+        threading.Thread(target=_collect_metrics, args=(read,), daemon=True).start()
+
+    def finish_request(self, request, client_address):
+        from metrics import REGISTRY
+
+        REGISTRY.clear()  # In the child: only this job's metrics are sent back
+        try:
+            super().finish_request(request, client_address)
+        finally:
+            with os.fdopen(self.metrics_pipe, "w") as pipe:
+                pipe.write(json.dumps(REGISTRY.dump()) + "\n")
+
+
+def _warm_up():
+    """
+    Imports everything a job needs, and fills the caches that are otherwise paid for on the first report.
+    """
+    import matplotlib
+
+    matplotlib.use("agg")
+    import seaborn as sns
+    from matplotlib import rcParams
+
+    from scraper import IMDBScraper
+    from scraper.utils import get_session
+    from search import search_imdb
+    from reports import TVReport, page_template, text_extent
+
+    sns.set(font_scale=0.7)
+    get_session()
+    for portrait in (False, True):
+        page_template("A4", portrait=portrait)
+    for cat in ("best", "worst"):
+        text_extent(f"{cat.title()} rated episode(s)", tuple(rcParams["font.family"]), 16)
+
+
+def serve(path=None, metrics=None):
+    """
+    Runs the popviz daemon in the foreground, handling every job in a forked child on a Unix socket.
+    With metrics set to a path, the metrics registry is written there periodically.
+    """
+    from metrics import export_metrics
+
+    if not hasattr(socket, "AF_UNIX") or not hasattr(os, "fork"):
+        print("The popviz daemon needs Unix sockets and fork, which this platform lacks.")
+        sys.exit(1)
+    path = Path(path or socket_path())
+    if path.exists():
+        if is_running(path):
+            print(f"A popviz daemon is already listening on {path}.")
+            sys.exit(1)
+        path.unlink()  # Left behind by a daemon that did not shut down cleanly
+    print("Warming up...")
+    _warm_up()
+    with export_metrics(metrics), _Server(str(path), _JobHandler) as server:
+        os.chmod(path, 0o600)
+        print(f"popviz daemon listening on {path}. Press Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            path.unlink()
+
+
+def _connect(path=None):
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    path = path or socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(str(path))
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def is_running(path=None):
+    sock = _connect(path)
+    if sock is None:
+        return False
+    sock.close()
+    return True
+
+
+class DaemonError(Exception):
+    pass
+
+
+def forward(op, path=None, **request):
+    """
+    Sends a job to the running daemon, printing its output as it arrives.
+    Returns a (forwarded, result) tuple; forwarded is False if no daemon is running,
+    if forwarding is disabled by setting the POPVIZ_NO_DAEMON environment variable,
+    or if the daemon went silent for longer than POPVIZ_DAEMON_TIMEOUT seconds (IDLE_TIMEOUT by default),
+    in which case the job should be run in-process.
+    """
+    if os.environ.get("POPVIZ_NO_DAEMON"):
+        return False, None
+    sock = _connect(path)
+    if sock is None:
+        return False, None
+    sock.settimeout(float(os.environ.get("POPVIZ_DAEMON_TIMEOUT", IDLE_TIMEOUT)))
+    request.update(op=op, cwd=str(Path.cwd()))
+    with sock, sock.makefile("rwb") as stream:
+        try:
+            stream.write((json.dumps(request) + "\n").encode())
+            stream.flush()
+            for line in stream:
+                message = json.loads(line)
+                if "log" in message:
+                    print(message["log"], end="")
+                elif "error" in message:
+                    raise DaemonError(message["error"])
+                else:
+                    return True, message["result"]
+        except socket.timeout:
+            print("\nThe popviz daemon is not responding, running the job here instead.\n")
+            return False, None
+    raise DaemonError("The popviz daemon closed the connection before finishing the job.")
+
+
+if __name__ == "__main__":
+    import matplotlib
+
+    matplotlib.use("agg")
+    _render_job(pickle.load(sys.stdin.buffer))
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+from regex import regex as re
+
+from scraper import IMDBScraper
+from reports.batch import init_worker, render_show, worker_context
+from reports.shared import publish_ratings
+from reports.tv_report_gen import record_timings
+from metrics import counter, export_metrics, gauge, histogram
+
+CONTENT_TYPES = {"png": "image/png", "svg": "image/svg+xml", "pdf": "application/pdf"}
+COLORS = ("red", "blue")
+
+
+class SingleFlight:
+    """
+        Runs at most one call per key at a time.
+        Callers asking for a key that is already being computed wait for, and share, its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self):
+        return len(self._calls)
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                future = self._calls[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class ReportService:
+    """
+        Builds reports on demand and caches them on disk.
+        Concurrent requests for the same (show, colour, format) share a single scrape and render,
+        and renders run in a pool of at most `workers` processes (the number of CPUs by default).
+    """
+
+    def __init__(
+        self,
+        cache_dir="./data/reports",
+        data_dir="./data",
+        max_age=24 * 3600,
+        workers=None,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.data_dir = Path(data_dir)
+        self.max_age = max_age
+        self.flights = SingleFlight()
+        gauge("popviz_http_builds_in_flight", "Reports being built").set_function(
+            self.flights.in_flight
+        )
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            initializer=init_worker,
+            mp_context=worker_context(),  # Workers are started lazily, from handler threads
+        )
+
+    def _cached(self, path):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        if time.time() - stat.st_mtime > self.max_age:
+            return None
+        return stat
+
+    def _build(self, show_id, color, file_format, filename):
+        scraper = IMDBScraper(show_id, log=False, data_dir=self.data_dir)
+        handle, shm = publish_ratings(scraper)
+        del scraper
+        # Render under a temporary name, so that a stale copy can keep being served meanwhile
+        tmp_name = f".{filename}.{threading.get_ident()}"
+        try:
+            result = self.pool.submit(
+                render_show, handle, self.cache_dir, color, tmp_name, file_format
+            ).result()
+        finally:
+            shm.close()
+            shm.unlink()
+        record_timings(result["timings"])
+        if result["error"]:
+            raise RuntimeError(result["error"])
+        path = self.cache_dir / f"{filename}.{file_format}"
+        os.replace(result["file"], path)
+        return path
+
+    def get(self, show_id, color="blue", file_format="png"):
+        """
+        Returns (path, os.stat_result) of the report, building it if it is missing or stale.
+        """
+        filename = f"{show_id}-{color}"
+        path = self.cache_dir / f"{filename}.{file_format}"
+        stat = self._cached(path)
+        if stat is None:
+            counter("popviz_http_cache_misses_total", "Reports built on demand").inc()
+            self.flights.do(
+                (show_id, color, file_format),
+                lambda: self._cached(path)
+                or self._build(show_id, color, file_format, filename),
+            )
+            stat = path.stat()
+        else:
+            counter("popviz_http_cache_hits_total", "Reports served from the cache").inc()
+        return path, stat
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def etag(stat):
+    return f'W/"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+class ReportHandler(BaseHTTPRequestHandler):
+    """
+        Serves GET /report/<imdb_id>.<png|svg|pdf>?color=<red|blue>
+    """
+
+    service = None
+    ROUTE = re.compile(r"^/report/(tt\d+)\.(\w+)$")
+
+    def do_GET(self):
+        counter("popviz_http_requests_total", "Requests received").inc()
+        with histogram("popviz_http_request_seconds", "Time spent serving requests").time():
+            self._get()
+
+    def _get(self):
+        url = urlparse(self.path)
+        match = self.ROUTE.match(url.path)
+        if match is None or match.group(2) not in CONTENT_TYPES:
+            self.send_error(404, "Expected /report/<imdb_id>.<png|svg|pdf>")
+            return
+        show_id, file_format = match.groups()
+        color = parse_qs(url.query).get("color", ["blue"])[0]
+        if color not in COLORS:
+            self.send_error(400, f"color must be one of {', '.join(COLORS)}")
+            return
+
+        try:
+            path, stat = self.service.get(show_id, color, file_format)
+        except Exception as e:
+            self.send_error(502, f"Could not build the report of {show_id}: {e}")
+            return
+
+        tag = etag(stat)
+        if tag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", tag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES[file_format])
+        self.send_header("Content-Length", str(stat.st_size))
+        self.send_header("ETag", tag)
+        self.send_header("Cache-Control", f"max-age={self.service.max_age}")
+        self.end_headers()
+        with path.open("rb") as fp:
+            self.wfile.write(fp.read())
+
+
+def serve_http(host="127.0.0.1", port=8000, metrics=None, **service_options):
+    """
+    Runs the report server in the foreground until interrupted.
+    With metrics set to a path, the metrics registry is written there periodically.
+    """
+    service = ReportService(**service_options)
+    handler = type("Handler", (ReportHandler,), {"service": service})
+    with export_metrics(metrics), ThreadingHTTPServer((host, port), handler) as server:
+        print(f"Serving reports on http://{host}:{port}/report/<imdb_id>.png")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.close()
@@ -1,10 +1,11 @@
+import argparse
 from pathlib import Path
 
 from regex import regex as re
 
-from scraper import IMDBScraper
+from batch import WorkQueue, run_batch, run_worker
+from scraper.images import ImageCache
 from scraper.utils import get_parsed_webpage
-from reports.tv_report_gen import TVReport
 
 
 def get_show_ids():
@@ -30,16 +31,41 @@ def get_id_from_link(link):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--queue",
+        help="Path to a queue file on shared storage. Every machine running this script "
+        "with the same queue file works on a different part of the chart.",
+    )
+    parser.add_argument(
+        "--metrics",
+        help="Periodically write throughput metrics to this file (.json or Prometheus text).",
+    )
+    parser.add_argument(
+        "--posters",
+        action="store_true",
+        help="Fetch the poster and episode images of every show, "
+        "and embed the posters in the reports (without --queue).",
+    )
+    args = parser.parse_args()
+
     print("Getting the top shows from IMDb")
     data_dir = Path.cwd() / "data"
     print(data_dir)
-    data_dir.mkdir(parents=True, exist_ok=True)
-    for title, link_id in get_show_ids():
-        print("=" * 50)
-        print(f"Visualizing {title}")
-        scraper = IMDBScraper(link_id)
-        reporter = TVReport(data_provider=scraper)
-        reporter.heatmap(output_dir=data_dir)
-        scraper.dump()
-        print("=" * 50)
-        print()
+    if args.queue:
+        queue = WorkQueue(args.queue)
+        queue.put(get_show_ids())  # Shows that are already queued are left untouched
+        run_worker(queue, data_dir=data_dir, output_dir=data_dir, metrics=args.metrics)
+        print(queue.stats())
+    else:
+        # Progress is checkpointed in the manifest, so rerunning this script picks up where it stopped.
+        manifest = run_batch(
+            get_show_ids(),
+            manifest_path=data_dir / "manifest.json",
+            data_dir=data_dir,
+            output_dir=data_dir,
+            memory_budget=1 << 30,  # Keep the render workers under ~1GB
+            metrics=args.metrics,
+            images=ImageCache(data_dir / "images") if args.posters else None,
+        )
+        print(manifest.summary())
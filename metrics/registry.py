@@ -0,0 +1,280 @@
+import bisect
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class Counter:
+    """
+        Monotonically increasing count, eg. pages fetched or bytes downloaded.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+    def prometheus(self):
+        return [f"{self.name} {self.value}"]
+
+
+class Gauge:
+    """
+        Value that goes up and down, eg. a queue depth.
+        It can be set directly, or computed by a function every time it is read.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._function = None
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        self._function = function
+
+    def snapshot(self):
+        if self._function is not None:
+            try:
+                return self._function()
+            except Exception:
+                return math.nan
+        return self.value
+
+    def prometheus(self):
+        return [f"{self.name} {self.snapshot()}"]
+
+
+class Histogram:
+    """
+        Distribution of observed values (eg. latencies in seconds) over fixed buckets.
+    """
+
+    kind = "histogram"
+    BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, help="", buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative, buckets = 0, {}
+        for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+        return dict(count=count, sum=total, buckets=buckets)
+
+    def merge(self, snapshot):
+        """
+        Adds a snapshot of a histogram with the same buckets (eg. taken in another process) to this one.
+        """
+        cumulative = list(snapshot["buckets"].values())
+        counts = [count - before for count, before in zip(cumulative, [0] + cumulative)]
+        with self._lock:
+            self.counts = [count + added for count, added in zip(self.counts, counts)]
+            self.count += snapshot["count"]
+            self.sum += snapshot["sum"]
+
+    def prometheus(self):
+        snapshot = self.snapshot()
+        lines = [
+            f'{self.name}_bucket{{le="{bound}"}} {count}'
+            for bound, count in snapshot["buckets"].items()
+        ]
+        lines.append(f"{self.name}_sum {snapshot['sum']}")
+        lines.append(f"{self.name}_count {snapshot['count']}")
+        return lines
+
+
+class Registry:
+    """
+        Process wide collection of metrics, exported as Prometheus text or JSON.
+        Metrics are created on first use, so instrumented code only pays for a dictionary lookup.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **options):
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self.metrics.setdefault(name, cls(name, help, **options))
+        return metric
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help=""):
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name, help="", buckets=Histogram.BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def dump(self):
+        """
+        Returns the counters and histograms as a JSON serialisable list, for merge in another process.
+        """
+        return [
+            dict(
+                kind=metric.kind,
+                name=metric.name,
+                help=metric.help,
+                buckets=getattr(metric, "buckets", None),
+                value=metric.snapshot(),
+            )
+            for metric in list(self.metrics.values())
+            if metric.kind != "gauge"
+        ]
+
+    def merge(self, dumped):
+        """
+        Adds the counters and histograms dumped by another registry (eg. in a forked child) to this one.
+        Gauges describe the state of their own process, and are not merged.
+        """
+        for data in dumped:
+            if data["kind"] == "counter":
+                self.counter(data["name"], data["help"]).inc(data["value"])
+            else:
+                histogram = self.histogram(data["name"], data["help"], data["buckets"])
+                histogram.merge(data["value"])
+
+    def clear(self):
+        with self._lock:
+            self.metrics = {}
+
+    def _after_fork(self):
+        # The fork may have happened while another thread (eg. export_metrics) held one of the locks
+        self._lock = threading.Lock()
+        for metric in self.metrics.values():
+            metric._lock = threading.Lock()
+
+    def to_prometheus(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.prometheus())
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        return dict(
+            time=time.time(),
+            uptime=time.time() - self.started,
+            metrics={
+                metric.name: metric.snapshot() for metric in list(self.metrics.values())
+            },
+        )
+
+
+REGISTRY = Registry()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=REGISTRY._after_fork)
+
+
+def counter(name, help=""):
+    return REGISTRY.counter(name, help)
+
+
+def gauge(name, help=""):
+    return REGISTRY.gauge(name, help)
+
+
+def histogram(name, help="", buckets=Histogram.BUCKETS):
+    return REGISTRY.histogram(name, help, buckets=buckets)
+
+
+def write_metrics(path, registry=REGISTRY):
+    """
+    Atomically writes a snapshot of registry to path: JSON if it ends in .json, Prometheus text otherwise
+    (eg. for the node exporter's textfile collector).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".json":
+        text = json.dumps(registry.to_dict())
+    else:
+        text = registry.to_prometheus()
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    with os.fdopen(fd, "w") as fp:
+        fp.write(text)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def export_metrics(path, interval=15, registry=REGISTRY):
+    """
+    Writes the metrics to path every interval seconds, in a background thread, while the block runs.
+    Does nothing if path is None.
+    """
+    if path is None:
+        yield
+        return
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            write_metrics(path, registry)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+        write_metrics(path, registry)
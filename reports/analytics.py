@@ -0,0 +1,148 @@
+import json
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+
+class Corpus:
+    """
+        Ratings of many shows, stored as one ragged array:
+        `ratings` holds every rated episode of every show, one season after the other,
+        `season_starts[i]` is the index of the first episode of season i in `ratings`,
+        and `show_starts[j]` is the index of the first season of show j in `season_starts`.
+        Every statistic is computed for the whole corpus at once, without looping over shows.
+    """
+
+    def __init__(self, show_ids, ratings, season_starts, show_starts):
+        self.show_ids = list(show_ids)
+        self.ratings = np.asarray(ratings, dtype=np.float64)
+        self.season_starts = np.asarray(season_starts, dtype=np.int64)
+        self.show_starts = np.asarray(show_starts, dtype=np.int64)
+        self._index = {show_id: i for i, show_id in enumerate(self.show_ids)}
+
+    @classmethod
+    def from_seasons(cls, shows):
+        """
+        Builds a corpus from a {show_id: seasons} dictionary, seasons being scraped by IMDBScraper.
+        Shows without a single rated episode are left out.
+        """
+        show_ids, ratings, season_starts, show_starts = [], [], [], []
+        for show_id, seasons in shows.items():
+            show_ratings = [
+                [
+                    float(episode["rating"])
+                    for episode in season["episodes"]
+                    if episode["rating"]
+                ]
+                for season in seasons
+            ]
+            if not any(show_ratings):
+                continue
+            show_ids.append(show_id)
+            show_starts.append(len(season_starts))
+            for season in show_ratings:
+                season_starts.append(len(ratings))
+                ratings.extend(season)
+        return cls(show_ids, ratings, season_starts, show_starts)
+
+    @classmethod
+    def load(cls, data_dir="./data"):
+        """
+        Builds a corpus from every data file dumped by IMDBScraper in data_dir (<show_id>.json).
+        """
+        shows = {}
+        for path in sorted(Path(data_dir).glob("tt*.json")):
+            with path.open() as fp:
+                shows[path.stem] = json.load(fp)
+        return cls.from_seasons(shows)
+
+    def __len__(self):
+        return len(self.show_ids)
+
+    @property
+    def seasons_per_show(self):
+        return np.diff(np.append(self.show_starts, len(self.season_starts)))
+
+    def _segment_means(self, starts):
+        """
+        Averages self.ratings over the segments [starts[i], starts[i + 1]), NaN for empty segments.
+        """
+        ends = np.append(starts[1:], len(self.ratings))
+        cumulative = np.concatenate(([0.0], np.cumsum(self.ratings)))
+        counts = ends - starts
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(
+                counts > 0, (cumulative[ends] - cumulative[starts]) / counts, np.nan
+            )
+
+    def season_means(self):
+        """
+        Returns the average rating of every season in the corpus (NaN for seasons without ratings).
+        """
+        return self._segment_means(self.season_starts)
+
+    def show_means(self):
+        """
+        Returns the average episode rating of every show.
+        """
+        return self._segment_means(self.season_starts[self.show_starts])
+
+    def season_matrix(self):
+        """
+        Returns a (shows x seasons) matrix of season averages, padded with NaN.
+        """
+        counts = self.seasons_per_show
+        rows = np.repeat(np.arange(len(self)), counts)
+        columns = np.arange(len(self.season_starts)) - np.repeat(self.show_starts, counts)
+        matrix = np.full((len(self), counts.max(initial=0)), np.nan)
+        matrix[rows, columns] = self.season_means()
+        return matrix
+
+    def trajectory(self):
+        """
+        Returns (mean, median, count) arrays, with the rating of the n-th season across every show
+        that has one, eg. to see how shows typically age.
+        """
+        matrix = self.season_matrix()
+        counts = np.sum(~np.isnan(matrix), axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # Seasons no show reached
+            return np.nanmean(matrix, axis=0), np.nanmedian(matrix, axis=0), counts
+
+    def percentiles(self):
+        """
+        Returns the percentile of every show's average rating among all the shows of the corpus.
+        """
+        means = self.show_means()
+        ordered = np.sort(means[~np.isnan(means)])
+        return np.searchsorted(ordered, means, side="right") / len(ordered) * 100
+
+    def percentile(self, show_id):
+        return float(self.percentiles()[self._index[show_id]])
+
+    def slopes(self):
+        """
+        Returns the least squares slope of the season averages of every show,
+        in rating points per season. NaN for shows with fewer than two rated seasons.
+        """
+        matrix = self.season_matrix()
+        valid = ~np.isnan(matrix)
+        x = np.where(valid, np.arange(matrix.shape[1]), 0.0)
+        y = np.where(valid, matrix, 0.0)
+        n = valid.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x_mean = x.sum(axis=1) / n
+            y_mean = y.sum(axis=1) / n
+            dx = np.where(valid, x - x_mean[:, np.newaxis], 0.0)
+            dy = np.where(valid, y - y_mean[:, np.newaxis], 0.0)
+            slopes = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+        return np.where(n >= 2, slopes, np.nan)
+
+    def declined_most(self, n=10):
+        """
+        Returns a list of (show_id, slope) for the (at most) n shows whose seasons declined the most.
+        """
+        slopes = self.slopes()
+        order = np.argsort(np.where(np.isnan(slopes), np.inf, slopes))[:n]
+        return [(self.show_ids[i], float(slopes[i])) for i in order if slopes[i] < 0]
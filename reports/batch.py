@@ -0,0 +1,252 @@
+import gc
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from matplotlib import pyplot as plt
+
+from reports.shared import SharedRatings, publish_ratings
+from reports.tv_report_gen import TVReport, record_timings
+from metrics import gauge
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Size of the RGBA canvas of a 300 dpi A4 page, the largest buffer a report holds.
+FIGURE_BYTES = int(11.69 * 300) * int(8.27 * 300) * 4
+# Text, collections, the png encoder and friends roughly triple that.
+FIGURE_OVERHEAD = 3
+# Resident size of an idle render worker, once numpy, matplotlib and seaborn are imported
+# (measured at 80-100MB on Linux), paid once per slot whether it renders or not.
+WORKER_BYTES = 100 * 2 ** 20
+
+
+class ShowSnapshot:
+    """
+        Minimal, picklable data provider for TVReport.
+        Holds only what a report needs, so that it can be shipped to a render worker
+        without dragging the scraper (and its cached pages) along.
+    """
+
+    def __init__(self, series, seasons, show_metadata):
+        self.series = series
+        self.seasons = seasons
+        self.show_metadata = show_metadata
+
+    @classmethod
+    def from_provider(cls, provider):
+        return cls(
+            getattr(provider, "series", None), provider.seasons, provider.show_metadata
+        )
+
+
+def current_rss():
+    """
+    Returns the resident set size of this process in bytes, or None when it cannot be measured.
+    Falls back to the peak RSS reported by getrusage outside of Linux.
+    """
+    try:
+        with open("/proc/self/statm") as fp:
+            pages = int(fp.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, everything else reports kilobytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakMemory:
+    """
+        Context manager that samples the RSS of the current process in a background thread,
+        and records the highest value seen while the block was running (peak),
+        and how far that is above the RSS the block started with (growth).
+        A long lived process rarely gives memory back, so growth is what the block itself cost.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.start = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = current_rss()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    @property
+    def growth(self):
+        if self.start is None or self.peak is None:
+            return None
+        return max(0, self.peak - self.start)
+
+    def __enter__(self):
+        self.start = current_rss()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def figure_slots(memory_budget=None, max_figures=None):
+    """
+    Returns the number of figures that may be in flight at once, each in its own worker process.
+    memory_budget is in bytes; max_figures defaults to the number of CPUs.
+    """
+    slots = max_figures or os.cpu_count() or 1
+    if memory_budget is not None:
+        per_slot = WORKER_BYTES + FIGURE_BYTES * FIGURE_OVERHEAD
+        slots = min(slots, memory_budget // per_slot)
+    return max(1, int(slots))
+
+
+def init_worker():
+    plt.switch_backend("agg")
+
+
+def worker_context():
+    """
+    Returns the multiprocessing context to start render workers with: forkserver if available, spawn otherwise.
+    Forking a process with other threads (eg. export_metrics, lease heartbeats) would copy the locks
+    they hold into the workers, where nothing ever releases them.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _open_report(source):
+    if isinstance(source, SharedRatings):
+        return TVReport.from_shared(source)
+    return TVReport(data_provider=source)
+
+
+def render_show(
+    source, output_dir, color, filename=None, file_format="png", poster=None
+):
+    """
+    Renders and saves the report of source (a data provider or a SharedRatings handle),
+    with the image at path poster if given, releasing everything it allocated. Meant to run in a worker process started with init_worker.
+    Returns a dictionary with keys id, title, file, error and peak_memory
+    (how much the RSS of the worker grew while rendering, in bytes).
+    """
+    result = dict(
+        id=source.series,
+        title=source.show_metadata.get("title"),
+        file=None,
+        error=None,
+        timings={},
+    )
+    with PeakMemory() as memory:
+        try:
+            with _open_report(source) as reporter:
+                reporter.heatmap(color=color, poster=poster)
+                output_file = reporter.save_file(
+                    filename=filename, output_dir=output_dir, file_format=file_format
+                )
+                result["file"] = str(output_file)
+                result["timings"] = reporter.timings
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        del source
+        gc.collect()
+    result["peak_memory"] = memory.growth
+    return result
+
+
+def _release(shm):
+    if shm is not None:
+        shm.close()
+        shm.unlink()
+
+
+def render_batch(
+    providers,
+    output_dir="./data",
+    color="blue",
+    memory_budget=None,
+    max_figures=None,
+    shared=True,
+    posters=None,
+):
+    """
+        Renders and saves a heatmap for every data provider (eg. IMDBScraper) in providers,
+        in a pool of worker processes. Yields one result dictionary per show, as they finish,
+        with keys id, title, file, error and peak_memory (see render_show).
+
+        At most figure_slots(memory_budget, max_figures) figures are in flight at a time.
+        providers is consumed lazily, so a generator that scrapes shows one by one
+        never runs more than that many shows ahead of the renderer.
+
+        With shared=True, ratings are handed to the workers through shared memory
+        (see reports.shared) instead of pickling every scraped season.
+        posters is an optional {show_id: image path} mapping, looked up as each show is pulled from providers,
+        of the posters to embed in the reports.
+    """
+    slots = figure_slots(memory_budget, max_figures)
+    providers = iter(providers)
+    pending = {}  # future -> shared memory block to release once it is done
+    in_flight = gauge("popviz_renders_in_flight", "Reports queued or rendering in workers")
+    with ProcessPoolExecutor(
+        max_workers=slots, initializer=init_worker, mp_context=worker_context()
+    ) as pool:
+        try:
+            while True:
+                while len(pending) < slots:
+                    provider = next(providers, None)
+                    if provider is None:
+                        break
+                    shm = None
+                    try:
+                        if shared:
+                            source, shm = publish_ratings(provider)
+                        else:
+                            source = ShowSnapshot.from_provider(provider)
+                    except Exception as e:  # eg. a show without a single rated episode
+                        yield dict(
+                            id=getattr(provider, "series", None),
+                            title=provider.show_metadata.get("title"),
+                            file=None,
+                            error=f"{type(e).__name__}: {e}",
+                            peak_memory=None,
+                            timings={},
+                        )
+                        continue
+                    poster = (posters or {}).get(getattr(provider, "series", None))
+                    del provider
+                    future = pool.submit(
+                        render_show, source, output_dir, color, poster=poster
+                    )
+                    pending[future] = shm
+                    in_flight.inc()
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    _release(pending.pop(future))
+                    in_flight.dec()
+                    result = future.result()
+                    record_timings(result["timings"])
+                    yield result
+        finally:
+            # Early exits (the caller closing the generator, a broken pool) leave shows in flight
+            for future, shm in pending.items():
+                future.cancel()
+                _release(shm)
+                in_flight.dec()
@@ -0,0 +1,80 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from reports.tv_report_gen import find_episodes, ratings_matrix
+
+
+class SharedRatings:
+    """
+        Picklable handle to a ratings matrix (and its season averages) living in shared memory.
+        Only the name of the block, its shape and the few bits of text a report prints
+        (show metadata, best and worst episodes) travel with the handle.
+    """
+
+    DTYPE = np.float64
+
+    def __init__(self, name, shape, series, show_metadata, episodes):
+        self.name = name
+        self.shape = tuple(shape)
+        self.series = series
+        self.show_metadata = show_metadata
+        self.episodes = episodes
+
+    @staticmethod
+    def nbytes(shape):
+        n_seasons, n_episodes = shape
+        return (n_seasons * n_episodes + n_seasons) * np.dtype(SharedRatings.DTYPE).itemsize
+
+    @staticmethod
+    def views(buffer, shape):
+        """
+        Returns the (ratings, season_averages) arrays backed by buffer, without copying.
+        """
+        n_seasons, n_episodes = shape
+        flat = np.ndarray(
+            (n_seasons * n_episodes + n_seasons,), dtype=SharedRatings.DTYPE, buffer=buffer
+        )
+        return flat[: n_seasons * n_episodes].reshape(shape), flat[n_seasons * n_episodes :]
+
+    def attach(self):
+        """
+        Attaches to the shared block, returning (shared_memory, ratings, season_averages).
+        The caller must drop the arrays before closing the shared memory.
+        """
+        shm = shared_memory.SharedMemory(name=self.name)
+        ratings, season_averages = SharedRatings.views(shm.buf, self.shape)
+        return shm, ratings, season_averages
+
+
+def publish_ratings(data_provider, series=None):
+    """
+    Copies the ratings matrix and season averages of data_provider (eg. IMDBScraper) into a new
+    shared memory block. Returns a (handle, shared_memory) tuple: the handle is what should be sent
+    to other processes, while the owner keeps the shared memory and unlinks it once they are done.
+    """
+    seasons = data_provider.seasons
+    ratings = ratings_matrix(seasons)
+    episodes = {
+        cat: [dict(episode) for episode in find_episodes(ratings, seasons, cat=cat)]
+        for cat in ("best", "worst")
+    }
+    shm = shared_memory.SharedMemory(
+        create=True, size=SharedRatings.nbytes(ratings.shape)
+    )
+    try:
+        shared_ratings, season_averages = SharedRatings.views(shm.buf, ratings.shape)
+        shared_ratings[:] = ratings
+        season_averages[:] = np.nanmean(ratings, axis=1)
+        del shared_ratings, season_averages
+        if series is None:
+            series = getattr(data_provider, "series", None)
+        handle = SharedRatings(
+            shm.name, ratings.shape, series, data_provider.show_metadata, episodes
+        )
+    except BaseException:
+        shared_ratings = season_averages = None  # Views would keep the block from closing
+        shm.close()
+        shm.unlink()
+        raise
+    return handle, shm
@@ -1,19 +1,153 @@
+from functools import lru_cache
 from pathlib import Path
 import math
+import time
 
 import numpy as np
 import seaborn as sns
-from matplotlib import gridspec, offsetbox, pyplot as plt
+from matplotlib import gridspec, offsetbox, pyplot as plt, rcParams
+from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.font_manager import FontProperties
 
 from reports.utils import pad_nan, wrap_text, format_filename
+from metrics import histogram
+
+PAGE_SIZES = {"A4": (11.69, 8.27), "A3": (16.53, 11.69)}  # (width, height)
+PALETTES = {"red": "YlOrRd", "blue": "YlGnBu"}
+
+
+@lru_cache(maxsize=None)
+def page_template(size="A4", portrait=False):
+    """
+    Returns the layout of a report page (figure size, row heights and text styles),
+    computed once per (size, orientation) for the whole process. Treat the result as read only.
+    """
+    assert size in PAGE_SIZES
+    page_width, page_height = PAGE_SIZES[size]
+    relative_heights = [2, 5.5, 1, 2.5]
+
+    title_params = dict(
+        xy=(0.5, 0.9), xycoords="axes fraction", va="center", ha="center", size=28
+    )
+
+    subtitle_params = dict(
+        xy=(0.5, 0.65), xycoords="axes fraction", va="center", ha="center", size=14
+    )
+
+    metadata_params = dict(xycoords="axes fraction", va="center", ha="left", size=12,)
+
+    if portrait:
+        page_height, page_width = page_width, page_height
+        subtitle_params["size"] = 18
+        relative_heights = [2.5, 5.5, 0.5, 2]
+
+    return dict(
+        figsize=(page_width, page_height),
+        relative_heights=relative_heights,
+        # Rows of the page taken by the best/worst episode panels
+        episode_rows=slice(3, None) if portrait else slice(2, None),
+        title_params=title_params,
+        subtitle_params=subtitle_params,
+        metadata_params=metadata_params,
+    )
+
+
+@lru_cache(maxsize=None)
+def _measuring_renderer(dpi):
+    return RendererAgg(1, 1, dpi)
+
+
+@lru_cache(maxsize=4096)
+def text_extent(text, family, size, dpi=300, weight="normal"):
+    """
+    Returns the (width, height) in pixels of a line of text, as drawn at dpi.
+    Measured once per (text, font, size), without a renderer pass over the figure.
+    """
+    prop = FontProperties(family=list(family), size=size, weight=weight)
+    width, height, _ = _measuring_renderer(dpi).get_text_width_height_descent(
+        text, prop, ismath=False
+    )
+    return width, height
+
+
+def ratings_matrix(seasons):
+    """
+    Builds the (seasons x episodes) ratings matrix from a list of scraped seasons,
+    padding shorter seasons with NaN.
+    """
+    ratings = []
+    for season in seasons:
+        episodes = [
+            float(episode["rating"])
+            for episode in season["episodes"]
+            if episode["rating"]
+        ]
+        ratings.append(episodes)
+    return pad_nan(ratings)
+
+
+def find_episodes(ratings, seasons, cat="best", inverted=False):
+    """
+    Returns the episode dictionaries of the best (or worst) rated episodes in the ratings matrix,
+    each with an added "season" key.
+    """
+    criteria = np.nanmax if cat == "best" else np.nanmin
+    result = np.where(
+        ratings == criteria(ratings)
+    )  # two tuples, with row, column indices respectively
+    episode_list = []
+    for season, episode in zip(*result):
+        if inverted:
+            episode, season = season, episode  # season will be across columns
+        episode_data = seasons[season]["episodes"][episode]
+        episode_data["season"] = int(season) + 1
+        episode_list.append(episode_data)
+    return episode_list
+
+
+def record_timings(timings):
+    """
+    Records the {stage: seconds} timings of a report (see TVReport.timings) in the metrics registry.
+    Used to collect the timings of reports rendered in other processes.
+    """
+    for stage, seconds in timings.items():
+        histogram(
+            f"popviz_report_{stage}_seconds", f"Time spent on the {stage} step of reports"
+        ).observe(seconds)
 
 
 class TVReport:
     def __init__(self, data_provider):
         sns.set(font_scale=0.7)
+        self.fig = None
+        self.page = None
+        self._shm = None
+        self._episodes = {}
+        self.timings = {}
         self.data = data_provider.seasons
         self.show_metadata = data_provider.show_metadata
-        self.ratings = self._get_2d_array()
+        self._set_ratings(self._get_2d_array())
+
+    @classmethod
+    def from_shared(cls, handle):
+        """
+        Builds a report on top of a ratings matrix published with reports.shared.publish_ratings,
+        without copying it. The scraped seasons are not needed (nor available) in this case.
+        """
+        report = cls.__new__(cls)
+        sns.set(font_scale=0.7)
+        report.fig = None
+        report.page = None
+        report._shm, ratings, season_averages = handle.attach()
+        report._episodes = handle.episodes
+        report.timings = {}
+        report.data = None
+        report.show_metadata = handle.show_metadata
+        report._set_ratings(ratings, season_averages)
+        return report
+
+    def _set_ratings(self, ratings, season_averages=None):
+        self.ratings = ratings
         self.mean = math.floor(np.nanmean(self.ratings))
         self.median = math.floor(np.nanmedian(self.ratings))
         self.n_seasons, self.n_episodes = self.ratings.shape
@@ -28,83 +162,78 @@ class TVReport:
             self.ratings = self.ratings.transpose()
             average_shape = (1, self.n_seasons)
 
-        self.season_averages = np.nanmean(self.ratings, axis=axis).reshape(
-            average_shape
-        )
+        if season_averages is None:
+            season_averages = np.nanmean(self.ratings, axis=axis)
+        self.season_averages = season_averages.reshape(average_shape)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Release the figure and every intermediate array held by this report.
+        Batch runs should call this (or use the report as a context manager)
+        as soon as the report has been saved.
+        """
+        self._close_figure()
+        self.data = None
+        self.ratings = None
+        self.season_averages = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def _close_figure(self):
+        if self.fig is not None:
+            plt.close(self.fig)
+        elif self.page is not None:
+            plt.close(self.page["fig"])
+        self.fig = None
+        self.page = None
 
     @property
     def is_square(self):
         return 1 <= max(self.ratings.shape) / min(self.ratings.shape) < 1.3
 
     def _get_2d_array(self):
-        ratings = []
-        for season in self.data:
-            episodes = [
-                np.float(episode["rating"])
-                for episode in season["episodes"]
-                if episode["rating"]
-            ]
-            ratings.append(episodes)
-        return pad_nan(np.array(ratings))
+        return ratings_matrix(self.data)
 
     def _setup_page_layout(self, size="A4"):
-        size_map = {"A4": (11.69, 8.27), "A3": (16.53, 11.69)}  # (width, height)
-        assert size in size_map
-        page_width, page_height = size_map[size]
-        relative_heights = [2, 5.5, 1, 2.5]
-
-        title_params = dict(
-            xy=(0.5, 0.9), xycoords="axes fraction", va="center", ha="center", size=28
-        )
-
-        subtitle_params = dict(
-            xy=(0.5, 0.65), xycoords="axes fraction", va="center", ha="center", size=14
-        )
+        # Square matrices look better on a portrait page
+        layout = page_template(size, portrait=self.is_square)
 
-        metadata_params = dict(xycoords="axes fraction", va="center", size=12,)
-
-        if self.is_square:
-            # Change orientation to portrait
-            page_height, page_width = page_width, page_height
-            subtitle_params["size"] = 18
-            relative_heights = [2.5, 5.5, 0.5, 2]
-
-        fig = plt.figure(
-            figsize=(page_width, page_height), dpi=300, constrained_layout=True
-        )
-        fig.set_size_inches(page_width, page_height)
+        fig = plt.figure(figsize=layout["figsize"], dpi=300, constrained_layout=True)
         spec = gridspec.GridSpec(
-            figure=fig, ncols=1, nrows=4, height_ratios=relative_heights
+            figure=fig, ncols=1, nrows=4, height_ratios=layout["relative_heights"]
+        )
+        ep_info = gridspec.GridSpecFromSubplotSpec(
+            1, 5, subplot_spec=spec[layout["episode_rows"], :]
         )
 
-        if self.is_square:
-            ep_info = gridspec.GridSpecFromSubplotSpec(1, 5, subplot_spec=spec[3, :])
-        else:
-            ep_info = gridspec.GridSpecFromSubplotSpec(1, 5, subplot_spec=spec[2:, :])
-
-        with sns.axes_style("white"):
-
-            title_ax = fig.add_subplot(spec[0, :])
-            spacer_ax = fig.add_subplot(spec[2, :])
-            misc = fig.add_subplot(ep_info[:, 2])
-            best_ep_ax = fig.add_subplot(ep_info[:, :2])
-            worst_ep_ax = fig.add_subplot(ep_info[:, 3:])
-            for ax in [title_ax, best_ep_ax, worst_ep_ax, spacer_ax, misc]:
-                sns.despine(ax=ax, bottom=True, left=True)  # , top=True, right=True)
-                ax.axes.xaxis.set_ticks([])
-                ax.axes.yaxis.set_ticks([])
+        title_ax = fig.add_subplot(spec[0, :])
+        spacer_ax = fig.add_subplot(spec[2, :])
+        misc = fig.add_subplot(ep_info[:, 2])
+        best_ep_ax = fig.add_subplot(ep_info[:, :2])
+        worst_ep_ax = fig.add_subplot(ep_info[:, 3:])
+        for ax in [title_ax, best_ep_ax, worst_ep_ax, spacer_ax, misc]:
+            ax.set_axis_off()  # Text only panels: no spines, ticks or background
 
+        title_params = layout["title_params"]
+        subtitle_params = layout["subtitle_params"]
+        metadata_params = layout["metadata_params"]
         title_ax.annotate(f"{self.show_metadata['title']}", **title_params)
         running_date = self.show_metadata.get(
             "running_date", ""
         )  # running date can be blank
         if running_date:
             title_ax.annotate(f"({running_date})", **subtitle_params)
-        plot = wrap_text(self.show_metadata["plot_summary"], 110)
+        # plot = wrap_text(self.show_metadata["plot_summary"], 110)
         # title_ax.annotate(
         #     "\n".join(plot), xy=(0.5, 0.55), style="italic", **metadata_params
         # )
-        metadata_params["ha"] = "left"
         # vertical_dist = 0.5 - 0.05 * len(plot)
         vertical_dist = 0.5
         writers = self.show_metadata.get("creators")
@@ -155,10 +284,13 @@ class TVReport:
             size=16,
             **info_params,
         )
-        title_box = title.get_window_extent(
-            renderer=title.get_figure().canvas.get_renderer()
+        title_width, _ = text_extent(
+            title.get_text(),
+            tuple(rcParams["font.family"]),
+            title.get_size(),
+            dpi=title.get_figure().dpi,
         )
-        rating_loc = (title_box.width + 50, 0) if best else (-title_box.width - 50, 0)
+        rating_loc = (title_width + 50, 0) if best else (-title_width - 50, 0)
         rating = ax.annotate(
             rating,
             xy=(horizontal_margin, 0.8),
@@ -205,25 +337,36 @@ class TVReport:
                 break
 
     def _get_episode(self, cat="best"):
-        criteria = np.nanmax if cat == "best" else np.nanmin
-        result = np.where(
-            self.ratings == criteria(self.ratings)
-        )  # two tuples, with row, column indices respectively
-        episode_list = []
-        for season, episode in zip(*result):
-            if self.inverted:
-                episode, season = season, episode  # season will be across columns
-            episode_data = self.data[season]["episodes"][episode]
-            episode_data["season"] = int(season) + 1
-            episode_list.append(episode_data)
-        return episode_list
+        if cat in self._episodes:  # Precomputed, eg. for reports built from shared memory
+            return self._episodes[cat]
+        return find_episodes(self.ratings, self.data, cat=cat, inverted=self.inverted)
+
+    def _add_poster(self, ax, poster, height=1.4):
+        """
+        Draws the image at path poster in the top right corner of ax, height inches tall.
+        """
+        image = plt.imread(str(poster))
+        # OffsetImage scales by dpi / 72, so this is independent of the figure dpi
+        zoom = height * 72 / image.shape[0]
+        box = offsetbox.AnnotationBbox(
+            offsetbox.OffsetImage(image, zoom=zoom),
+            (1, 0.5),
+            xycoords="axes fraction",
+            box_alignment=(1, 0.5),
+            frameon=False,
+        )
+        ax.add_artist(box)
 
     def heatmap(
-        self, color="red",
+        self, color="red", poster=None,
     ):
+        """
+        Draws the report. poster is the path of an image to embed next to the title,
+        eg. a thumbnail from scraper.images.ImageCache, so that nothing is downloaded here.
+        """
+        start = time.perf_counter()
         colormap = {
-            "red": sns.color_palette("YlOrRd", 10),
-            "blue": sns.color_palette("YlGnBu", 10),
+            name: sns.color_palette(palette, 10) for name, palette in PALETTES.items()
         }
         height, width = self.ratings.shape
         yticks = np.arange(1, height + 1)
@@ -231,11 +374,14 @@ class TVReport:
         xticks = np.arange(1, width + 1)
         x_label = "Episode"
         # Setting up matplotlib and seaborn
+        self._close_figure()  # Never leak the figure of a previous call
         self._setup_page_layout()
         fig = self.page["fig"]
 
         # Set up heatmap specific layout
         title_ax, best_ep_ax, worst_ep_ax = self.page["axes"]
+        if poster is not None:
+            self._add_poster(title_ax, poster)
 
         if self.inverted:
             main_section = gridspec.GridSpecFromSubplotSpec(
@@ -298,20 +444,69 @@ class TVReport:
         # plt.show()
 
         self.fig = fig
+        self._record_timing("render", start)
 
-    def save_file(self, filename=None, output_dir=".", file_format="png"):
-        if not self.fig:
-            print(
-                "Could not find a figure. Ensure that you have called the heatmap function."
-            )
+    def _record_timing(self, stage, start):
+        self.timings[stage] = time.perf_counter() - start
+        record_timings({stage: self.timings[stage]})
 
+    def output_path(self, filename=None, output_dir=".", file_format="png"):
+        """
+        Returns the path save_file will write to, creating output_dir if needed.
+        """
         if filename is None:
             filename = format_filename(self.show_metadata["title"])
         filename = f"{filename}.{file_format}"
         output_dir = Path(output_dir)
         if not Path.exists(output_dir):
             Path.mkdir(output_dir, parents=True)
-        output_file = output_dir / filename
+        return output_dir / filename
+
+    def save_preview(self, filename=None, output_dir=".", color="red", dpi=80):
+        """
+        Renders and saves a quick, low resolution heatmap of the ratings alone
+        (no annotations, averages or episode details), in a fraction of the time of the full report.
+        It reuses the matrix and statistics of this report, so heatmap can still be called afterwards.
+        Saved as <filename>_preview.png, returns its path.
+        """
+        start = time.perf_counter()
+        if filename is None:
+            filename = format_filename(self.show_metadata["title"])
+        output_file = self.output_path(f"{filename}_preview", output_dir)
+
+        height, width = self.ratings.shape
+        figsize = (max(4, width * 0.3 + 1.5), max(3, height * 0.3 + 1))
+        fig, ax = plt.subplots(figsize=figsize)
+        sns.heatmap(
+            self.ratings,
+            vmax=10,
+            vmin=math.floor(np.nanmin(self.ratings)),
+            cmap=sns.color_palette(PALETTES[color], 10),
+            xticklabels=np.arange(1, width + 1),
+            yticklabels=np.arange(1, height + 1),
+            ax=ax,
+        )
+        labels = ["Episode", "Season"]
+        if self.inverted:
+            labels.reverse()
+        ax.set_xlabel(labels[0])
+        ax.set_ylabel(labels[1])
+        ax.set_title(self.show_metadata["title"])
+        fig.savefig(output_file, dpi=dpi, bbox_inches="tight")
+        plt.close(fig)
+        self._record_timing("preview", start)
+        return output_file
+
+    def save_file(self, filename=None, output_dir=".", file_format="png"):
+        if not self.fig:
+            print(
+                "Could not find a figure. Ensure that you have called the heatmap function."
+            )
+            return
+
+        output_file = self.output_path(filename, output_dir, file_format)
+        start = time.perf_counter()
         self.fig.savefig(output_file, dpi=300, bbox_inches="tight", pad_inches=0.2)
-        plt.close(self.fig)
+        self._close_figure()
+        self._record_timing("save", start)
         return output_file
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import numpy as np
 from regex import regex as re
 
@@ -8,13 +10,18 @@ def pad_nan(matrix):
     """
     lens = np.array(list(map(len, matrix)))
     mask = np.arange(lens.max()) < lens[:, np.newaxis]
-    output = np.empty(mask.shape, dtype=np.float)
+    output = np.empty(mask.shape, dtype=float)
     output.fill(np.nan)
     output[mask] = np.concatenate(matrix)
     return output
 
 
+@lru_cache(maxsize=4096)
 def wrap_text(text, column_width=60):
+    """
+    Splits text into lines of roughly column_width characters, breaking on spaces.
+    Results are cached, and returned as tuples so that they can be shared safely.
+    """
     char_count = 0
     lines = []
     line = ""
@@ -27,7 +34,7 @@ def wrap_text(text, column_width=60):
             line = ""
     if line:
         lines.append(line)
-    return lines
+    return tuple(lines)
 
 
 def format_filename(string):
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from scraper.utils import POOL_SIZE, get_session, record_response, write_json_atomic
+from metrics import counter
+
+THUMBNAIL_SIZE = (280, 420)  # Enough for the 1.4 inch tall poster of a 300 dpi report
+
+
+class ImageCache:
+    """
+        Content addressed cache of the posters and episode images found by IMDBScraper.
+        Images are stored once per distinct content (by SHA-256), whatever the number of URLs
+        pointing to them, and their thumbnails are generated once, on first use.
+    """
+
+    def __init__(self, cache_dir="./data/images", thumbnail_size=THUMBNAIL_SIZE):
+        self.cache_dir = Path(cache_dir)
+        self.thumbnail_size = tuple(thumbnail_size)
+        self.index_file = self.cache_dir / "index.json"
+        self.index = {}  # url -> content hash
+        if self.index_file.exists():
+            with self.index_file.open() as fp:
+                self.index = json.load(fp)
+        self._lock = threading.Lock()
+
+    def _blob_path(self, digest):
+        return self.cache_dir / "blobs" / digest[:2] / digest
+
+    def _thumbnail_path(self, digest):
+        size = "x".join(map(str, self.thumbnail_size))
+        return self.cache_dir / "thumbnails" / size / f"{digest}.png"
+
+    def path(self, url):
+        """
+        Returns the path of the cached image for url, or None if it has not been fetched.
+        """
+        digest = self.index.get(url)
+        if digest is None:
+            return None
+        blob = self._blob_path(digest)
+        if not blob.exists():
+            return None
+        counter("popviz_image_cache_hits_total", "Images served from the cache").inc()
+        return blob
+
+    def _download(self, url):
+        counter("popviz_image_cache_misses_total", "Images downloaded").inc()
+        resp = get_session().get(url, timeout=30)
+        record_response(resp)
+        resp.raise_for_status()
+        digest = hashlib.sha256(resp.content).hexdigest()
+        blob = self._blob_path(digest)
+        if not blob.exists():  # Identical images behind different URLs are stored once
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp = blob.with_name(f".{digest}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(resp.content)
+            tmp.replace(blob)
+        with self._lock:
+            self.index[url] = digest
+        return blob
+
+    def save(self):
+        with self._lock:
+            write_json_atomic(self.index_file, self.index)
+
+    def fetch(self, url):
+        """
+        Returns the path of the image at url, downloading it only if it is not cached yet.
+        """
+        cached = self.path(url)
+        if cached is not None:
+            return cached
+        blob = self._download(url)
+        self.save()
+        return blob
+
+    def fetch_all(self, urls, workers=POOL_SIZE):
+        """
+        Fetches every image in urls that is not cached yet, concurrently over the shared connection pool.
+        Returns a {url: path} dictionary, images that could not be fetched map to None.
+        """
+        urls = {url for url in urls if url}
+        paths = {url: self.path(url) for url in urls}
+        missing = [url for url, path in paths.items() if path is None]
+
+        def download(url):
+            try:
+                return url, self._download(url)
+            except Exception:
+                return url, None
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                paths.update(pool.map(download, missing))
+            self.save()
+        return paths
+
+    def thumbnail(self, url):
+        """
+        Returns the path of a downscaled PNG of the image at url, generating it only once.
+        """
+        blob = self.fetch(url)
+        thumbnail = self._thumbnail_path(blob.name)
+        if not thumbnail.exists():
+            thumbnail.parent.mkdir(parents=True, exist_ok=True)
+            with Image.open(blob) as image:
+                image.thumbnail(self.thumbnail_size)
+                image.convert("RGB").save(thumbnail, format="PNG")
+        return thumbnail
+
+
+def image_urls(data_provider):
+    """
+    Returns the URLs of the show poster and of every episode image of a data provider (eg. IMDBScraper).
+    """
+    urls = [data_provider.show_metadata.get("poster_url")]
+    for season in data_provider.seasons:
+        urls.extend(episode.get("poster_url") for episode in season["episodes"])
+    return [url for url in urls if url]
@@ -1,10 +1,10 @@
-import sys
 import json
 from pathlib import Path
 
 from regex import regex as re
 
-from scraper.utils import get_parsed_webpage
+from scraper.utils import get_parsed_webpage, write_json_atomic
+from metrics import counter
 
 from tqdm import tqdm
 
@@ -19,16 +19,20 @@ class IMDBScraper:
 
     BASE_URL = "https://www.imdb.com/title"
 
-    def __init__(self, series_ID, log=True):
-        self.log = True
+    def __init__(self, series_ID, log=True, data_dir=None, use_cache=True):
+        self.log = log
         self.series = series_ID
         self.url = f"{self.BASE_URL}/{self.series}"
-        self.data_file = Path.cwd() / f"data/{self.series}.json"
+        self.data_dir = Path(data_dir) if data_dir else Path.cwd() / "data"
+        self.data_file = self.data_dir / f"{self.series}.json"
         self.cached_episode_data = []
         self.episode_data = []
-        if self.data_file.exists():
+        if use_cache and self.data_file.exists():
             with self.data_file.open() as fp:
                 self.cached_episode_data = json.load(fp)
+            counter("popviz_data_cache_hits_total", "Shows loaded from data files").inc()
+        else:
+            counter("popviz_data_cache_misses_total", "Shows without a data file").inc()
         self._get_show_data()
         self._get_latest_season()
 
@@ -41,8 +45,7 @@ class IMDBScraper:
         elif not self.episode_data:
             self.get_all_seasons()
         if not self.episode_data:
-            sys.exit()
-        # TODO: Add better handling for this edge case, at least a message
+            raise ValueError(f"No episodes found for {self.series}.")
         return self.episode_data
 
     @property
@@ -70,6 +73,38 @@ class IMDBScraper:
             Returns a dictionary of show level data
         """
         webpage = get_parsed_webpage(self.url)
+        self.show_data = IMDBScraper._parse_show_page(webpage)
+
+    @classmethod
+    def get_signals(cls, series_ID):
+        """
+            Returns a dictionary of cheap signals (rating, number of ratings and episodes, latest season,
+            running date), which change whenever new episodes or ratings are added to a show.
+            Only fetches the main page of the show.
+        """
+        webpage = get_parsed_webpage(f"{cls.BASE_URL}/{series_ID}")
+        data = cls._parse_show_page(webpage)
+        signals = {
+            key: data[key] for key in ("rating", "num_ratings", "num_episodes")
+        }
+        signals["latest_season"] = cls._get_latest_season_number(webpage)
+        signals["running_date"] = data.get("running_date", "")
+        return signals
+
+    @staticmethod
+    def _get_latest_season_number(webpage):
+        nav = webpage.find(class_="seasons-and-year-nav")
+        if nav is None:
+            return None
+        seasons = []
+        for link in nav.select("a[href*='season=']"):
+            result = re.search(r"season=(\d+)", link["href"])
+            if result:
+                seasons.append(int(result.group(1)))
+        return max(seasons, default=None)
+
+    @staticmethod
+    def _parse_show_page(webpage):
         details = webpage.find(class_="title_bar_wrapper")
         title = details.select(".title_wrapper h1")[0].text.strip()
         rating = details.select(".ratings_wrapper .ratingValue span")[0].text.strip()
@@ -107,7 +142,7 @@ class IMDBScraper:
             poster_url=poster,
         )
         data.update(additional_details)
-        self.show_data = data
+        return data
 
     @staticmethod
     def _get_additional_details(details):
@@ -213,19 +248,23 @@ class IMDBScraper:
         return data
 
     def dump(self, filename=None, data_dir="./data"):
+        """
+            Writes the scraped seasons to the data file, returning its path,
+            or None if no season was scraped (single season shows, shows loaded from the data file).
+        """
         if not self.episode_data:
             if self.log:
                 print("No new data loaded, so there is nothing to dump.")
-            return
+            return None
         if filename is not None:
             self.data_file = Path(data_dir) / filename
         if self.data_file.exists():
             if self.log:
                 print("Overwriting data file...")
-        with self.data_file.open("w+") as fp:
-            json.dump(self.episode_data, fp)
+        write_json_atomic(self.data_file, self.episode_data)
         if self.log:
             print(f"File written successfully to {self.data_file}.")
+        return self.data_file
 
 
 if __name__ == "__main__":
@@ -1,13 +1,73 @@
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup as bs
 
+from metrics import counter, histogram
+
+POOL_SIZE = 32
+
+_session = None
+
+
+def get_session():
+    """
+    Returns the requests session shared by the whole process,
+    so that every request (pages and images alike) reuses pooled keep-alive connections.
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
+
 def get_parsed_webpage(url, parser="lxml"):
     """
     Takes a url string as paramter, makes a GET request,
     and then instantiates a BeautifulSoup object with the parser specified.
     Default parser is lxml.
     """
-    resp = requests.get(url)
+    start = time.perf_counter()
+    resp = get_session().get(url)
+    record_response(resp)
+    histogram("popviz_page_fetch_seconds", "Time spent fetching pages").observe(
+        time.perf_counter() - start
+    )
+    counter("popviz_pages_fetched_total", "Pages fetched from IMDb").inc()
     soup = bs(resp.text, parser)
     return soup
-    
\ No newline at end of file
+
+
+def record_response(resp):
+    """
+    Counts the bytes downloaded for a response of the shared session.
+    """
+    counter("popviz_downloaded_bytes_total", "Bytes downloaded").inc(len(resp.content))
+
+
+def write_json_atomic(path, data):
+    """
+    Serializes data as JSON to path, through a temporary file in the same directory,
+    so that readers (or a crashed run) never see a half written file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as fp:
+            json.dump(data, fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
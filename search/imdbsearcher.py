@@ -2,6 +2,7 @@ from regex import regex as re
 import urllib.parse
 
 from scraper.utils import get_parsed_webpage
+from metrics import counter
 
 
 def get_data_from_row(row):
@@ -29,6 +30,7 @@ def get_data_from_row(row):
 
 
 def search_imdb(query):
+    counter("popviz_searches_total", "Searches made on IMDb").inc()
     encoded = urllib.parse.quote(query)
     url = f"https://www.imdb.com/find?q={encoded}&s=tt&ttype=tv"
     webpage = get_parsed_webpage(url)
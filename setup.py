@@ -17,7 +17,7 @@ DESCRIPTION = "A command-line tool written in Python to scrape ratings data of T
 URL = "https://github.com/me/myproject"
 EMAIL = "joshuanazareth97@gmail.com"
 AUTHOR = "Joshua Nazareth"
-REQUIRES_PYTHON = ">=3.6"
+REQUIRES_PYTHON = ">=3.8"
 VERSION = "0.1.0"
 
 # What packages are required for this module to be executed?
@@ -29,6 +29,7 @@ REQUIRED = [
     "matplotlib>=3.2.1",
     "numpy>=1.18.2",
     "pandas>=1.0.3",
+    "Pillow>=7.0.0",
     "seaborn>=0.10.0",
     "tqdm>=4.45.0",
 ]
@@ -125,7 +126,7 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: Implementation :: CPython",
         "Programming Language :: Python :: Implementation :: PyPy",
     ],
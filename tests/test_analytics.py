@@ -0,0 +1,65 @@
+import json
+
+import numpy as np
+import pytest
+
+from reports.analytics import Corpus
+
+
+def season(number, *ratings):
+    episodes = [dict(rating=str(rating) if rating else "") for rating in ratings]
+    return dict(number=number, episodes=episodes)
+
+
+SHOWS = {
+    "tt1": [season(1, 8, 9), season(2, 7), season(3, 6, 6, 6)],
+    "tt2": [season(1, 5), season(2, None), season(3, 7)],
+    "tt3": [season(1, 9, 9)],
+    "tt4": [season(1, None)],  # Never rated, left out
+}
+
+
+@pytest.fixture
+def corpus():
+    return Corpus.from_seasons(SHOWS)
+
+
+def test_shows_without_ratings_are_left_out(corpus):
+    assert corpus.show_ids == ["tt1", "tt2", "tt3"]
+    assert list(corpus.seasons_per_show) == [3, 3, 1]
+
+
+def test_means(corpus):
+    np.testing.assert_allclose(
+        corpus.season_means(), [8.5, 7, 6, 5, np.nan, 7, 9], equal_nan=True
+    )
+    np.testing.assert_allclose(corpus.show_means(), [7, 6, 9])
+
+
+def test_season_matrix_and_trajectory(corpus):
+    matrix = corpus.season_matrix()
+    assert matrix.shape == (3, 3)
+    np.testing.assert_allclose(matrix[2], [9, np.nan, np.nan], equal_nan=True)
+    mean, median, counts = corpus.trajectory()
+    np.testing.assert_allclose(mean, [7.5, 7, 6.5])
+    assert list(counts) == [3, 1, 2]
+
+
+def test_percentiles(corpus):
+    assert list(corpus.percentiles()) == pytest.approx([200 / 3, 100 / 3, 100])
+    assert corpus.percentile("tt3") == 100
+
+
+def test_slopes_and_decline(corpus):
+    slopes = corpus.slopes()
+    assert slopes[0] == pytest.approx(-1.25)
+    assert slopes[1] == pytest.approx(1)
+    assert np.isnan(slopes[2])  # A single season has no trend
+    assert corpus.declined_most() == [("tt1", pytest.approx(-1.25))]
+
+
+def test_load(tmp_path):
+    for show_id, seasons in SHOWS.items():
+        (tmp_path / f"{show_id}.json").write_text(json.dumps(seasons))
+    (tmp_path / "manifest.json").write_text("{}")
+    assert Corpus.load(tmp_path).show_ids == ["tt1", "tt2", "tt3"]
@@ -0,0 +1,29 @@
+import sys
+
+import pytest
+
+from reports.batch import (
+    FIGURE_BYTES,
+    FIGURE_OVERHEAD,
+    WORKER_BYTES,
+    PeakMemory,
+    figure_slots,
+)
+
+
+def test_figure_slots_count_the_worker_and_its_figure():
+    per_slot = WORKER_BYTES + FIGURE_BYTES * FIGURE_OVERHEAD
+    assert figure_slots(5 * per_slot, max_figures=64) == 5
+    assert figure_slots(per_slot - 1, max_figures=64) == 1
+    assert figure_slots(None, max_figures=3) == 3
+    assert figure_slots(1 << 30, max_figures=64) * per_slot <= 1 << 30
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Reads /proc")
+def test_peak_memory_growth_is_relative_to_the_start():
+    ballast = bytearray(64 * 2 ** 20)  # Raises the RSS the next block starts from
+    ballast[::4096] = b"x" * len(ballast[::4096])
+    with PeakMemory(interval=0.01) as memory:
+        pass
+    assert memory.peak >= memory.start >= len(ballast)
+    assert memory.growth < len(ballast)
@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+import batch.changes
+from batch.changes import ChangeFeed, diff_episodes, episode_ratings
+
+METADATA = dict(
+    title="Some Show", creators=[], stars=[], tags=[], running_date="2010–"
+)
+
+
+def season(number, *ratings, numbered=True):
+    episodes = [
+        dict(
+            title=f"S{number}E{e + 1}",
+            episode_number=str(e + 1) if numbered else "",
+            rating=rating,
+            plot="Plot",
+        )
+        for e, rating in enumerate(ratings)
+    ]
+    return dict(number=number, episodes=episodes)
+
+
+class FakeScraper:
+    shows = {}
+
+    def __init__(self, series_ID, log=True, data_dir=None, use_cache=True):
+        self.series = series_ID
+        self.seasons = self.shows[series_ID]["seasons"]
+        self.show_metadata = METADATA
+
+    @classmethod
+    def get_signals(cls, series_ID):
+        return cls.shows[series_ID]["signals"]
+
+    def dump(self):
+        return None
+
+
+@pytest.fixture
+def feed(tmp_path, monkeypatch):
+    FakeScraper.shows = {}
+    monkeypatch.setattr(batch.changes, "IMDBScraper", FakeScraper)
+    return ChangeFeed(tmp_path / "snapshots.json", tmp_path / "changes.jsonl")
+
+
+def read_feed(feed):
+    with feed.feed_path.open() as fp:
+        return [json.loads(line) for line in fp]
+
+
+def test_episode_ratings():
+    seasons = [season(1, "8.0", "8.5"), season(2, "7.0", "9.0", numbered=False)]
+    assert episode_ratings(seasons) == {
+        "1:1": dict(title="S1E1", rating="8.0"),
+        "1:2": dict(title="S1E2", rating="8.5"),
+        "2:1": dict(title="S2E1", rating="7.0"),  # Numbered by position
+        "2:2": dict(title="S2E2", rating="9.0"),
+    }
+
+
+def test_diff_episodes():
+    old = episode_ratings([season(1, "8.0", "8.5")])
+    new = episode_ratings([season(1, "8.0", "8.7"), season(2, "9.1")])
+    assert diff_episodes(old, new) == dict(
+        episodes_added=[dict(episode="2:1", title="S2E1", rating="9.1")],
+        ratings_changed=[dict(episode="1:2", title="S1E2", old="8.5", new="8.7")],
+    )
+    assert diff_episodes(new, new) == dict(episodes_added=[], ratings_changed=[])
+
+
+def test_record_stores_the_snapshot_and_appends_the_diff(feed):
+    feed.record("tt1", dict(num_episodes="2"), [season(1, "8.0", "8.5")])
+    diff = feed.record("tt1", dict(num_episodes="3"), [season(1, "8.0", "8.7", "9.0")])
+    assert [episode["episode"] for episode in diff["episodes_added"]] == ["1:3"]
+    assert [episode["episode"] for episode in diff["ratings_changed"]] == ["1:2"]
+    assert diff["signals"] == dict(old=dict(num_episodes="2"), new=dict(num_episodes="3"))
+
+    lines = read_feed(feed)
+    assert [line["id"] for line in lines] == ["tt1", "tt1"]
+    assert lines[-1] == diff
+    reloaded = ChangeFeed(feed.snapshot_path, feed.feed_path)
+    assert reloaded.snapshots["tt1"]["episodes"]["1:2"]["rating"] == "8.7"
+    assert reloaded.snapshots["tt1"]["changes"] == 2
+
+
+def test_refresh_only_updates_changed_shows(feed, tmp_path):
+    for show_id in ("tt1", "tt2"):
+        FakeScraper.shows[show_id] = dict(
+            signals=dict(num_episodes="2"), seasons=[season(1, "8.0", "8.5")]
+        )
+    first = feed.refresh(["tt1", "tt2"], data_dir=tmp_path, output_dir=tmp_path, log=False)
+    assert sorted(diff["id"] for diff in first) == ["tt1", "tt2"]
+
+    FakeScraper.shows["tt2"] = dict(
+        signals=dict(num_episodes="3"), seasons=[season(1, "8.0", "8.7", "9.0")]
+    )
+    (diff,) = feed.refresh(["tt1", "tt2"], data_dir=tmp_path, output_dir=tmp_path, log=False)
+    assert diff["id"] == "tt2"
+    assert diff["episodes_added"] == [dict(episode="1:3", title="S1E3", rating="9.0")]
+    assert diff["ratings_changed"] == [
+        dict(episode="1:2", title="S1E2", old="8.5", new="8.7")
+    ]
+    assert read_feed(feed)[-1] == diff
+    assert feed.snapshots["tt1"]["checks"] == 2
+    assert feed.snapshots["tt1"]["changes"] == 1
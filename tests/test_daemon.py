@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+
+import pytest
+
+import cli.daemon
+from cli.daemon import _JobHandler, _Server, _render_in_background, forward
+from metrics import REGISTRY
+from reports.batch import ShowSnapshot
+
+METADATA = dict(
+    title="Some Show", creators=[], stars=[], tags=[], running_date="2010–"
+)
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="Needs fork")
+
+
+def nap(request):
+    print("Napping...")
+    time.sleep(request["seconds"])
+    REGISTRY.counter("test_naps_total").inc()
+    return request["seconds"]
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    monkeypatch.setitem(cli.daemon.JOBS, "nap", nap)
+    monkeypatch.delenv("POPVIZ_NO_DAEMON", raising=False)
+    path = tmp_path / "popviz.sock"
+    with _Server(str(path), _JobHandler) as server:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield path
+        server.shutdown()
+        thread.join()
+
+
+def test_jobs_run_concurrently(daemon, capsys):
+    naps = REGISTRY.counter("test_naps_total").value
+    results = []
+
+    def client():
+        results.append(forward("nap", path=daemon, seconds=1))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.perf_counter() - start < 2
+    assert results == [(True, 1)] * 3
+    assert capsys.readouterr().out.count("Napping...") == 3
+
+    deadline = time.time() + 2  # The children's metrics are merged in the background
+    while REGISTRY.counter("test_naps_total").value < naps + 3 and time.time() < deadline:
+        time.sleep(0.01)
+    assert REGISTRY.counter("test_naps_total").value == naps + 3
+
+
+def test_silent_daemon_falls_back_to_running_in_process(daemon, monkeypatch):
+    monkeypatch.setenv("POPVIZ_DAEMON_TIMEOUT", "0.2")
+    assert forward("nap", path=daemon, seconds=1) == (False, None)
+
+
+def test_no_daemon(tmp_path):
+    assert forward("nap", path=tmp_path / "missing.sock", seconds=0) == (False, None)
+
+
+def background_job(tmp_path, seasons, daemon=None):
+    return dict(
+        show=ShowSnapshot("tt1", seasons, METADATA),
+        color="blue",
+        poster=None,
+        output_dir=tmp_path,
+        filename="report",
+        error_log=tmp_path / "report.error.log",
+        daemon=str(daemon) if daemon else None,
+    )
+
+
+def wait_for(condition, timeout=60):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "The background render did not finish"
+        time.sleep(0.1)
+
+
+def test_background_render_reports_its_timings(tmp_path, daemon):
+    seasons = [
+        dict(
+            number=s + 1,
+            episodes=[
+                dict(
+                    title=f"S{s + 1}E{e + 1}",
+                    episode_number=str(e + 1),
+                    rating="8.0",
+                    plot="Plot",
+                )
+                for e in range(4)
+            ],
+        )
+        for s in range(2)
+    ]
+    renders = REGISTRY.histogram("popviz_report_save_seconds").count
+    assert _render_in_background(background_job(tmp_path, seasons, daemon))
+    wait_for(lambda: REGISTRY.histogram("popviz_report_save_seconds").count > renders)
+    assert (tmp_path / "report.png").exists()
+    assert not (tmp_path / "report.error.log").exists()
+
+
+def test_background_render_failures_are_logged(tmp_path):
+    assert _render_in_background(background_job(tmp_path, [dict(number=1, episodes=[])]))
+    error_log = tmp_path / "report.error.log"
+    wait_for(lambda: error_log.exists() and error_log.stat().st_size)
+    assert "Traceback" in error_log.read_text()
+    assert not (tmp_path / "report.png").exists()
@@ -0,0 +1,86 @@
+import io
+
+import pytest
+from PIL import Image
+
+import scraper.images
+from scraper.images import ImageCache
+
+
+def png(color, size=(600, 900)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+IMAGES = {
+    "https://img/a.jpg": png("red"),
+    "https://img/a-copy.jpg": png("red"),
+    "https://img/b.jpg": png("blue"),
+}
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, timeout=None):
+        self.requests.append(url)
+        return FakeResponse(IMAGES[url])
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(scraper.images, "get_session", lambda: session)
+    monkeypatch.setattr(scraper.images, "record_response", lambda resp: None)
+    return session
+
+
+def blobs(cache):
+    return sorted(path.name for path in (cache.cache_dir / "blobs").rglob("*") if path.is_file())
+
+
+def test_identical_images_are_stored_once(tmp_path, session):
+    cache = ImageCache(tmp_path)
+    paths = cache.fetch_all([*IMAGES, None])
+    assert len(paths) == 3
+    assert paths["https://img/a.jpg"] == paths["https://img/a-copy.jpg"]
+    assert paths["https://img/a.jpg"] != paths["https://img/b.jpg"]
+    assert len(blobs(cache)) == 2
+
+
+def test_the_url_index_is_persisted(tmp_path, session):
+    ImageCache(tmp_path).fetch_all(IMAGES)
+    assert len(session.requests) == 3
+
+    cache = ImageCache(tmp_path)
+    assert cache.path("https://img/b.jpg").read_bytes() == IMAGES["https://img/b.jpg"]
+    assert cache.fetch("https://img/a-copy.jpg").exists()
+    assert cache.path("https://img/unknown.jpg") is None
+    assert len(session.requests) == 3
+
+
+def test_thumbnails_are_generated_once(tmp_path, session, monkeypatch):
+    cache = ImageCache(tmp_path, thumbnail_size=(100, 150))
+    thumbnail = cache.thumbnail("https://img/a.jpg")
+    with Image.open(thumbnail) as image:
+        assert image.size == (100, 150)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The thumbnail was generated again")
+
+    monkeypatch.setattr(scraper.images.Image, "open", fail)
+    assert cache.thumbnail("https://img/a-copy.jpg") == thumbnail  # Same content
+    assert ImageCache(tmp_path, thumbnail_size=(100, 150)).thumbnail(
+        "https://img/a.jpg"
+    ) == thumbnail
+    assert len(session.requests) == 2
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+import batch.runner
+from batch.manifest import Manifest
+from reports.batch import ShowSnapshot
+
+SEASONS = [{"number": 1, "episodes": [{"title": "Pilot", "rating": "8.0"}]}]
+
+
+def test_steps_are_run_in_order(tmp_path):
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.add("tt1", "Some Show")
+    assert manifest.state("tt1") == "pending"
+    assert manifest.next_step("tt1") == "scraped"
+    manifest.advance("tt1", "scraped")
+    manifest.advance("tt1", "dumped")
+    assert manifest.next_step("tt1") == "rendered"
+    manifest.advance("tt1", "rendered", file="tt1.png")
+    assert manifest.next_step("tt1") is None
+    assert not manifest.is_runnable("tt1")
+    assert manifest.summary() == {"rendered": 1}
+
+
+def test_failures_are_retried_until_max_attempts(tmp_path):
+    manifest = Manifest(tmp_path / "manifest.json", max_attempts=2)
+    manifest.add("tt1")
+    manifest.fail("tt1", "boom")
+    assert manifest.state("tt1") == "failed"
+    assert manifest.is_runnable("tt1")
+    manifest.fail("tt1", "boom")
+    assert not manifest.is_runnable("tt1")
+
+
+def test_progress_survives_a_restart(tmp_path):
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.add("tt1", "Some Show")
+    manifest.advance("tt1", "scraped")
+    reloaded = Manifest(tmp_path / "manifest.json")
+    assert reloaded.shows["tt1"]["title"] == "Some Show"
+    assert reloaded.next_step("tt1") == "dumped"
+
+
+class FakeScraper:
+    created = []
+
+    def __init__(self, series_ID, log=True, data_dir=None):
+        if series_ID == "empty":
+            raise ValueError("No episodes found for empty.")
+        FakeScraper.created.append(series_ID)
+        self.series = series_ID
+        self.data_file = data_dir / f"{series_ID}.json"
+        self.seasons = SEASONS
+        self.show_metadata = dict(title=series_ID.upper())
+
+    def dump(self):
+        if self.series == "single":  # Nothing to write for single season shows
+            return None
+        self.data_file.write_text(json.dumps(self.seasons))
+        return self.data_file
+
+
+@pytest.fixture
+def scraper(monkeypatch):
+    FakeScraper.created = []
+    monkeypatch.setattr(batch.runner, "IMDBScraper", FakeScraper)
+    return FakeScraper
+
+
+def test_only_written_data_files_mark_shows_dumped(tmp_path, scraper):
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.add("tt1")
+    manifest.add("single")
+    shows = ["tt1", "single"]
+    providers = list(batch.runner._scrape_shows(shows, manifest, tmp_path, False))
+    assert [provider.series for provider in providers] == ["tt1", "single"]
+    assert manifest.shows["tt1"]["step"] == "dumped"
+    assert manifest.shows["tt1"]["metadata"] == dict(title="TT1")
+    assert manifest.shows["single"]["step"] == "scraped"
+
+
+def test_dumped_shows_are_not_scraped_again(tmp_path, scraper):
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.add("tt1")
+    list(batch.runner._scrape_shows(["tt1"], manifest, tmp_path, False))
+    scraper.created = []
+
+    (provider,) = batch.runner._scrape_shows(["tt1"], manifest, tmp_path, False)
+    assert scraper.created == []
+    assert isinstance(provider, ShowSnapshot)
+    assert provider.seasons == SEASONS
+    assert provider.show_metadata == dict(title="TT1")
+
+
+def test_shows_that_cannot_be_scraped_are_failed(tmp_path, scraper):
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.add("empty")
+    assert list(batch.runner._scrape_shows(["empty"], manifest, tmp_path, False)) == []
+    assert manifest.state("empty") == "failed"
+    assert manifest.shows["empty"]["error"] == "ValueError: No episodes found for empty."
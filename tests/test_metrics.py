@@ -0,0 +1,121 @@
+import json
+import math
+import os
+import signal
+import time
+
+import pytest
+
+from metrics import REGISTRY, Registry, export_metrics, write_metrics
+
+
+def test_metrics_are_created_once():
+    registry = Registry()
+    registry.counter("pages_total").inc()
+    registry.counter("pages_total").inc(2)
+    assert registry.counter("pages_total").value == 3
+
+
+def test_gauge_function():
+    registry = Registry()
+    gauge = registry.gauge("queue_depth")
+    gauge.set(4)
+    assert gauge.snapshot() == 4
+    gauge.set_function(lambda: 1 / 0)
+    assert math.isnan(registry.to_dict()["metrics"]["queue_depth"])
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("fetch_seconds", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value)
+    assert histogram.snapshot() == dict(
+        count=4, sum=6.05, buckets={"0.1": 1, "1": 3, "+Inf": 4}
+    )
+
+
+def test_prometheus_text():
+    registry = Registry()
+    registry.counter("pages_total", "Pages fetched").inc(2)
+    registry.histogram("fetch_seconds", buckets=(1,)).observe(0.5)
+    assert registry.to_prometheus().splitlines() == [
+        "# HELP pages_total Pages fetched",
+        "# TYPE pages_total counter",
+        "pages_total 2",
+        "# TYPE fetch_seconds histogram",
+        'fetch_seconds_bucket{le="1"} 1',
+        'fetch_seconds_bucket{le="+Inf"} 1',
+        "fetch_seconds_sum 0.5",
+        "fetch_seconds_count 1",
+    ]
+
+
+def test_write_metrics_picks_the_format_from_the_suffix(tmp_path):
+    registry = Registry()
+    registry.counter("pages_total").inc()
+    write_metrics(tmp_path / "metrics.json", registry)
+    write_metrics(tmp_path / "metrics.prom", registry)
+    data = json.loads((tmp_path / "metrics.json").read_text())
+    assert data["metrics"] == {"pages_total": 1}
+    assert "pages_total 1" in (tmp_path / "metrics.prom").read_text()
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "metrics.json",
+        "metrics.prom",
+    ]  # No temporary files left behind
+
+
+def test_export_metrics_writes_periodically_and_on_exit(tmp_path):
+    registry = Registry()
+    path = tmp_path / "metrics.json"
+    pages = registry.counter("pages_total")
+    with export_metrics(path, interval=0.05, registry=registry):
+        pages.inc()
+        time.sleep(0.2)
+        assert json.loads(path.read_text())["metrics"]["pages_total"] == 1
+        pages.inc()
+    assert json.loads(path.read_text())["metrics"]["pages_total"] == 2
+
+
+def test_export_metrics_without_a_path():
+    with export_metrics(None):
+        pass
+
+
+def test_merge_adds_counters_and_histograms():
+    child = Registry()
+    child.counter("pages_total", "Pages").inc(2)
+    child.gauge("in_flight").set(3)
+    child.histogram("fetch_seconds", buckets=(0.1, 1)).observe(0.5)
+    dumped = json.loads(json.dumps(child.dump()))
+
+    registry = Registry()
+    registry.counter("pages_total").inc()
+    registry.histogram("fetch_seconds", buckets=(0.1, 1)).observe(5)
+    registry.merge(dumped)
+    registry.merge(dumped)
+    assert registry.counter("pages_total").value == 5
+    assert "in_flight" not in registry.metrics
+    assert registry.histogram("fetch_seconds").snapshot() == dict(
+        count=3, sum=6.0, buckets={"0.1": 0, "1": 2, "+Inf": 3}
+    )
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Needs fork")
+def test_forked_children_do_not_inherit_held_locks():
+    histogram = REGISTRY.histogram("test_fork_seconds")
+    with histogram._lock:  # As if export_metrics was taking a snapshot
+        pid = os.fork()
+        if pid == 0:
+            histogram.observe(1)
+            os._exit(0)
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            assert os.WEXITSTATUS(status) == 0
+            return
+        time.sleep(0.01)
+    os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    pytest.fail("The forked child deadlocked")
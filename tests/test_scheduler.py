@@ -0,0 +1,109 @@
+import time
+
+import pytest
+
+import batch.changes
+from batch.changes import ChangeFeed
+from batch.scheduler import DAY, CrawlScheduler, is_running, parse_count
+
+SHOWS = [f"tt{i}" for i in range(10)]
+
+
+def signals(show_id, running_date="2010–"):
+    return dict(
+        rating="8.0",
+        num_ratings=f"{int(show_id[2:]) + 1},000",
+        num_episodes="20",
+        latest_season=2,
+        running_date=running_date,
+    )
+
+
+def snapshot(show_id, age, **fields):
+    scraped = time.time() - age
+    return dict(signals=signals(show_id, **fields), scraped=scraped, episodes={})
+
+
+class FakeScraper:
+    checked = []
+
+    @classmethod
+    def get_signals(cls, show_id):
+        cls.checked.append(show_id)
+        return signals(show_id)
+
+
+@pytest.fixture
+def feed(tmp_path, monkeypatch):
+    FakeScraper.checked = []
+    monkeypatch.setattr(batch.changes, "IMDBScraper", FakeScraper)
+    feed = ChangeFeed(tmp_path / "snapshots.json", tmp_path / "changes.jsonl")
+    feed.snapshots = {show_id: snapshot(show_id, age=30 * DAY) for show_id in SHOWS}
+    return feed
+
+
+def test_unchanged_shows_do_not_take_the_budget_every_run(feed):
+    scheduler = CrawlScheduler(feed.snapshots)
+    budget = 5 * scheduler.cost("tt0")
+
+    first = CrawlScheduler(feed.snapshots).plan(SHOWS, budget)
+    assert len(first) == 5
+    assert feed.check(first) == []
+
+    second = CrawlScheduler(feed.snapshots, now=time.time() + 3600).plan(SHOWS, budget)
+    assert len(second) == 5
+    assert not set(first) & set(second)
+    assert feed.check(second) == []
+
+    third = CrawlScheduler(feed.snapshots, now=time.time() + 7200).plan(SHOWS, budget)
+    assert third == []
+
+
+def test_checks_are_persisted(feed):
+    feed.check(["tt1"])
+    reloaded = ChangeFeed(feed.snapshot_path, feed.feed_path)
+    assert reloaded.snapshots["tt1"]["checks"] == 1
+    assert reloaded.snapshots["tt1"]["checked"] > reloaded.snapshots["tt1"]["scraped"]
+
+
+def test_unchanged_shows_are_charged_a_signal_check(feed):
+    scheduler = CrawlScheduler(feed.snapshots)
+    before = scheduler.cost("tt1")
+    for _ in range(8):
+        feed.check(["tt1"])
+    assert scheduler.cost("tt1") == pytest.approx(1 + 4 / 10)  # Close to one request
+    assert scheduler.cost("tt1") < before / 2
+    assert scheduler.cost("new") > before
+
+
+def test_new_signals_do_not_count_as_changes(feed):
+    del feed.snapshots["tt1"]["signals"]["running_date"]
+    assert feed.check(["tt1"]) == []
+    assert feed.snapshots["tt1"]["signals"]["running_date"] == "2010–"
+
+
+def test_refresh_interval(feed):
+    scheduler = CrawlScheduler(feed.snapshots)
+    ended = snapshot("tt1", age=0, running_date="2005–2010")
+    running = snapshot("tt1", age=0)
+    airing = dict(running, last_airdate=time.time() - DAY)
+    unknown = snapshot("tt1", age=0)
+    del unknown["signals"]["running_date"]  # Written before running_date was a signal
+    assert scheduler.refresh_interval(ended) == scheduler.ended_interval
+    assert scheduler.refresh_interval(running) == scheduler.running_interval
+    assert scheduler.refresh_interval(airing) == scheduler.airing_interval
+    assert scheduler.refresh_interval(unknown) == scheduler.running_interval
+
+
+def test_new_and_popular_shows_go_first(feed):
+    scheduler = CrawlScheduler(feed.snapshots)
+    assert scheduler.plan(["tt1", "new", "tt9"], budget=1000) == ["new", "tt9", "tt1"]
+
+
+def test_parsers():
+    assert parse_count("1,234") == 1234
+    assert parse_count("1.2M") == 1200000
+    assert parse_count("") == 0
+    assert is_running("2005– ")
+    assert not is_running("2005–2010")
+    assert not is_running("")
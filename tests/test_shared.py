@@ -0,0 +1,123 @@
+import pickle
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+import reports.batch
+import reports.shared
+from reports.batch import ShowSnapshot, render_batch
+from reports.shared import publish_ratings
+from reports.tv_report_gen import TVReport
+
+METADATA = dict(
+    title="Some Show", creators=[], stars=[], tags=[], running_date="2010–"
+)
+
+
+def show(n_seasons, n_episodes, series="tt1"):
+    seasons = [
+        dict(
+            number=s + 1,
+            episodes=[
+                dict(
+                    title=f"S{s + 1}E{e + 1}",
+                    episode_number=str(e + 1),
+                    rating=str(round(5 + (s * 7 + e * 3) % 50 / 10, 1)),
+                    plot="Plot",
+                )
+                for e in range(n_episodes)
+            ],
+        )
+        for s in range(n_seasons)
+    ]
+    return ShowSnapshot(series, seasons, METADATA)
+
+
+def titles(episodes):
+    return sorted(episode["title"] for episode in episodes)
+
+
+def is_unlinked(name):
+    try:
+        shared_memory.SharedMemory(name=name).close()
+    except FileNotFoundError:
+        return True
+    return False
+
+
+@pytest.mark.parametrize(
+    "shape", [(3, 8), (5, 5), (8, 3)], ids=["landscape", "square", "inverted"]
+)
+def test_shared_report_matches_the_scraped_one(shape):
+    provider = show(*shape)
+    handle, shm = publish_ratings(provider)
+    try:
+        with TVReport(data_provider=provider) as expected:
+            with TVReport.from_shared(handle) as report:
+                assert report.inverted == expected.inverted == (shape == (8, 3))
+                np.testing.assert_array_equal(report.ratings, expected.ratings)
+                np.testing.assert_allclose(
+                    report.season_averages, expected.season_averages
+                )
+                assert (report.mean, report.median) == (expected.mean, expected.median)
+                for cat in ("best", "worst"):
+                    assert titles(report._get_episode(cat)) == titles(
+                        expected._get_episode(cat)
+                    )
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_handles_are_small():
+    handle, shm = publish_ratings(show(20, 24))
+    try:
+        assert len(pickle.dumps(handle)) < 2048
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_failed_publish_releases_the_block(monkeypatch):
+    created = []
+    original = shared_memory.SharedMemory
+
+    def tracking(*args, **kwargs):
+        shm = original(*args, **kwargs)
+        created.append(shm.name)
+        return shm
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(reports.shared.shared_memory, "SharedMemory", tracking)
+    monkeypatch.setattr(reports.shared.np, "nanmean", fail)
+    with pytest.raises(RuntimeError):
+        publish_ratings(show(3, 4))
+    assert created and all(map(is_unlinked, created))
+
+
+def test_closing_render_batch_early_releases_every_block(tmp_path, monkeypatch):
+    published = []
+
+    def tracking(provider):
+        handle, shm = publish_ratings(provider)
+        published.append(handle.name)
+        return handle, shm
+
+    monkeypatch.setattr(reports.batch, "publish_ratings", tracking)
+    providers = [show(2, 3, series=f"tt{i}") for i in range(4)]
+    results = render_batch(providers, output_dir=tmp_path, max_figures=2)
+    first = next(results)
+    results.close()
+    assert first["error"] is None
+    assert len(published) >= 2
+    assert all(map(is_unlinked, published))
+
+
+def test_shows_without_ratings_are_reported(tmp_path):
+    empty = ShowSnapshot("tt0", [dict(number=1, episodes=[])], METADATA)
+    (result,) = render_batch([empty], output_dir=tmp_path, max_figures=1)
+    assert result["id"] == "tt0"
+    assert result["error"]
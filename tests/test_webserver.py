@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+
+import pytest
+
+from cli.webserver import SingleFlight, etag
+
+
+def test_concurrent_calls_share_one_result():
+    flights = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def build():
+        calls.append(1)
+        release.wait(2)
+        return "report.png"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flights.do("tt1", build)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    while flights.in_flight() == 0:
+        time.sleep(0.01)
+    time.sleep(0.1)  # Let every thread join the flight
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == ["report.png"] * 5
+    assert flights.in_flight() == 0
+
+
+def test_errors_are_shared_and_not_cached():
+    flights = SingleFlight()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flights.do("tt1", fail)
+    assert flights.do("tt1", lambda: "report.png") == "report.png"
+
+
+def test_etag_changes_with_the_file(tmp_path):
+    path = tmp_path / "report.png"
+    path.write_bytes(b"old")
+    before = etag(path.stat())
+    os.utime(path, ns=(0, 10 ** 9))
+    assert etag(path.stat()) != before
+    assert etag(path.stat()).startswith('W/"')
@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+from batch import workqueue
+from batch.workqueue import WorkQueue, run_worker
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite", lease_timeout=600, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def expire_leases(queue):
+    queue.db.execute("UPDATE jobs SET lease_expires = 0 WHERE state = 'leased'")
+
+
+def test_put_ignores_shows_already_queued(queue):
+    queue.put(["tt1", ("Some Show", "tt2")])
+    queue.put(["tt1"])
+    assert queue.stats() == {"pending": 2}
+
+
+def test_leases_are_exclusive(queue, tmp_path):
+    queue.put(["tt1", "tt2", "tt3"])
+    other = WorkQueue(tmp_path / "queue.sqlite")
+    try:
+        assert queue.lease("a", n=2) == ["tt1", "tt2"]
+        assert other.lease("b", n=2) == ["tt3"]
+        assert other.lease("b") == []
+    finally:
+        other.close()
+    assert queue.stats() == {"leased": 3}
+
+
+def test_expired_lease_counts_as_an_attempt(queue):
+    queue.put(["tt1"])
+    assert queue.lease("a") == ["tt1"]
+    expire_leases(queue)
+    assert queue.lease("b") == ["tt1"]
+    assert not queue.renew("tt1", "a")
+    assert not queue.complete("tt1", "a", {})
+    assert queue.complete("tt1", "b", dict(file="tt1.png"))
+
+    (row,) = queue.results()
+    assert row["attempts"] == 1
+    assert row["worker"] == "b"
+    assert row["result"] == dict(file="tt1.png")
+
+
+def test_show_fails_after_max_attempts(queue):
+    queue.put(["tt1"])
+    queue.lease("a")
+    assert queue.fail("tt1", "a", "boom")
+    assert queue.stats() == {"pending": 1}
+    queue.lease("a")
+    expire_leases(queue)
+    assert queue.lease("a") == []
+    assert queue.stats() == {"failed": 1}
+    (row,) = queue.results()
+    assert row["attempts"] == 2
+    assert row["error"] == "Lease expired on a"
+
+
+def test_heartbeat_keeps_the_lease(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite", lease_timeout=0.3)
+    queue.put(["tt1"])
+    queue.lease("a")
+    with queue.heartbeat("tt1", "a") as lost:
+        time.sleep(0.8)
+    assert not lost.is_set()
+    assert queue.lease("b") == []
+    assert queue.complete("tt1", "a", {})
+    queue.close()
+
+
+def test_heartbeat_notices_a_lost_lease(queue):
+    queue.put(["tt1"])
+    queue.lease("a")
+    with queue.heartbeat("tt1", "a", interval=0.05) as lost:
+        expire_leases(queue)
+        assert queue.lease("b") == ["tt1"]
+        assert lost.wait(2)
+    assert queue.renew("tt1", "b")
+
+
+def test_shows_lost_to_another_worker_are_not_counted(queue, monkeypatch):
+    def lose(show_id, lost, *args):
+        expire_leases(queue)
+        assert queue.lease("b") == [show_id]
+        queue.complete(show_id, "b", {})
+        raise workqueue.LeaseLost(show_id)
+
+    def fail(show_id, lost, *args):
+        raise ValueError("No episodes found")
+
+    queue.put(["tt1"])
+    monkeypatch.setattr(workqueue, "_process_show", lose)
+    assert run_worker(queue, "a", poll_interval=0, log=False) == 0
+
+    queue.put(["tt2"])
+    monkeypatch.setattr(workqueue, "_process_show", fail)
+    assert run_worker(queue, "a", poll_interval=0, log=False) == 2  # Two attempts